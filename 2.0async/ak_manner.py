@@ -1,30 +1,56 @@
 import asyncio
 import time
-from typing import Dict, Optional
+import weakref
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
 from aiohttp import ClientSession, ClientTimeout, ClientConnectionError, ClientError
 import aiohttp
 from flask import json
 import requests
-from config import MAX_RETRIES
+from config import (MAX_RETRIES, AK_BACKOFF_S, AK_MAX_BACKOFF_S, DISPATCH_INFLIGHT_PER_QPS,
+                    HTTP_CONN_LIMIT, HTTP_CONN_LIMIT_PER_HOST, HTTP_KEEPALIVE_S, HTTP_DNS_TTL_S, HTTP_TIMEOUT_S,
+                    USE_SINGLE_FLIGHT)
+from single_flight import SingleFlight, SyncSingleFlight, request_key
+
+# 百度返回这些状态码说明该 AK 的配额 / 并发 / 权限出了问题，换 AK 重试而不是原地重试
+QUOTA_ERROR_STATUS = (4, 5, 301, 302, 401)
+
+# AKDispatcher 为当前任务分配的 AK：[AK, api_type, 是否已经 acquire（真正要发请求）]。
+# 用 ContextVar 绑定到任务上，single-flight 的请求任务继承它，缓存命中或合并到别人请求的任务不会用到
+_dispatch_slot: ContextVar[Optional[list]] = ContextVar("_dispatch_slot", default=None)
+
+# 所有 AK 共享的请求合并表（键不含 ak）
+_single_flight = SingleFlight()
+_sync_single_flight = SyncSingleFlight()
 
 class BaiduAPIError(Exception):
-    """百度 API 返回的业务错误"""
-    def __init__(self, status: int, message: str, response: dict):
+    """百度 API 返回的业务错误；ak 为真正收到该状态的 AK（single-flight 分发给等待者时不变）"""
+    def __init__(self, status: int, message: str, response: dict, ak: Optional["AK"] = None):
         self.status = status
         self.message = message
         self.response = response
+        self.ak = ak
         super().__init__(f"[BaiduAPIError] status={status}, message={message}")
 
 class AK:
+    # 已创建会话的 AK，供 close_all 在进程退出时统一关闭
+    _open: "weakref.WeakSet[AK]" = weakref.WeakSet()
+
     def __init__(self, ak: str, qps_limit: Dict[str, int]):
         self.ak = ak
         self.qps_limit = qps_limit                                                            
         self.session: aiohttp.ClientSession | None = None
+        self.session_loop: Optional[asyncio.AbstractEventLoop] = None   # 会话所属的事件循环
         self.lock: Optional[asyncio.Lock] = None     # 同上，延迟初始化
         self.rate = qps_limit
         self.capacity = qps_limit
+        # 每种 api_type 独立的令牌桶：令牌数 + 上次补充时间
+        now = time.monotonic()
         self.tokens = {k: float(v) for k, v in self.capacity.items()}
-        self.timestamp = time.monotonic()
+        self.last_refill = {k: now for k in self.capacity}
+        self.pending: Dict[str, int] = {}         # 调度器已分配给任务、尚未取令牌的请求数（只影响挑选，不占令牌）
+        self.blocked_until: Dict[str, float] = {} # 配额类错误后的暂停截止时间（monotonic）
+        self.failures: Dict[str, int] = {}        # 连续配额类错误次数
         self.lock = asyncio.Lock()    # 防止并发竞争
 
     def get_ak(self) -> str:
@@ -34,115 +60,202 @@ class AK:
         return self.qps_limit.get(api_type, 3)
 
     async def start(self):
-        """启动时创建会话"""
-        self.tokens = {k: float(v) for k, v in self.capacity.items()}
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
-            print(f"✅ AK {self.ak} session 已创建")
-        if getattr(self, "lock", None) is None:
-            self.lock = asyncio.Lock()
+        """
+        在当前事件循环中创建会话（keep-alive 连接池 + DNS 缓存）。会话绑定创建它的循环，
+        通常由 async_runtime 的常驻循环创建后一直复用；换了循环时重建会话与锁。
+        令牌桶状态跨会话保留，重建会话不会重新获得突发额度。
+        """
+        loop = asyncio.get_running_loop()
+        if self.session is not None and not self.session.closed and self.session_loop is loop:
+            return
+        old, old_loop = self.session, self.session_loop
+        if old is not None and not old.closed and old_loop is not None and old_loop.is_running():
+            # 旧会话只能在它自己的循环里关闭
+            asyncio.run_coroutine_threadsafe(old.close(), old_loop)
+        connector = aiohttp.TCPConnector(limit=HTTP_CONN_LIMIT, limit_per_host=HTTP_CONN_LIMIT_PER_HOST,
+                                         keepalive_timeout=HTTP_KEEPALIVE_S, ttl_dns_cache=HTTP_DNS_TTL_S)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=ClientTimeout(total=HTTP_TIMEOUT_S))
+        self.session_loop = loop
+        self.lock = asyncio.Lock()
+        AK._open.add(self)
+        print(f"✅ AK {self.ak} session 已创建")
 
     async def close(self):
         """关闭会话"""
         if self.session:
             await self.session.close()
             print(f"🧹 AK {self.ak} session 已关闭")
-        if self.lock:
-            self.lock = None
+        self.session = None
+        self.session_loop = None
+        self.lock = None
+        AK._open.discard(self)
+
+    @classmethod
+    async def close_all(cls):
+        """关闭所有已创建的会话（需在会话所属的事件循环中调用）"""
+        await asyncio.gather(*[ak.close() for ak in list(cls._open)], return_exceptions=True)
 
     # ------------------------
     # 令牌桶算法限流
     # ------------------------
     async def acquire(self, api_type: str):
-        now = time.monotonic()
-        # 计算距离上次放入令牌的时间差
-        delta = now - self.timestamp
-
-        # 当前类型的速率与容量（默认3）
-        print(f"AK {self.ak} acquire for api_type={api_type}: rate={self.rate.get(api_type, 3)}, capacity={self.capacity.get(api_type, 3)}")
-        rate = self.rate.get(api_type, 3)
-        capacity = self.capacity.get(api_type, 3)
-
-        # 当前令牌数量（保底）
-        current = self.tokens.get(api_type, capacity)
-
-        # 增加令牌（但不超过容量上限）
-        new_tokens = min(capacity, current + delta * rate)
-        # 保证 self.tokens 是字典并写回当前 api_type
-        if not isinstance(self.tokens, dict):
-            self.tokens = {}
-        self.tokens[api_type] = new_tokens
-        self.timestamp = now
-
-        # 如果没有足够令牌，等待补充
-        if self.tokens.get(api_type, 0) < 1:
-            sleep_time = (1 - self.tokens.get(api_type, 0)) / rate
-            await asyncio.sleep(sleep_time)
-            self.tokens[api_type] = 0  # 等待后再扣除
-            self.timestamp = time.monotonic()
-        else:
-            self.tokens[api_type] -= 1
+        """
+        取一个令牌。锁只保护令牌记账：在锁内补充令牌并预扣 1 个（可扣成负数，表示排队中的预约），
+        需要等待时在锁外 sleep，不阻塞同一 AK 上的其他请求。
+        调度器分配给本任务的 AK 在这里才真正占用令牌（缓存命中的任务不会走到这里），并遵守配额错误的暂停。
+        """
+        slot = _dispatch_slot.get()
+        dispatched = slot is not None and slot[0] is self and slot[1] == api_type and not slot[2]
+        if dispatched:
+            slot[2] = True
+            self.pending[api_type] -= 1
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            now = time.monotonic()
+            wait = self._reserve(api_type, now)
+            if dispatched:
+                wait = max(wait, self.blocked_until.get(api_type, 0.0) - now)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _reserve(self, api_type: str, now: Optional[float] = None) -> float:
+        """
+        按 api_type 自己的桶补充并预扣一个令牌，返回需要等待的秒数（调用方需持有 self.lock）。
+        欠额（令牌为负）按速率精确折算等待时间，不做“等待后置 0”的近似。
+        now: 当前时间（默认 time.monotonic()，模拟时传入虚拟时钟）
+        """
+        if now is None:
+            now = time.monotonic()
+        rate = float(self.rate.get(api_type, 3))
+        capacity = float(self.capacity.get(api_type, 3))
+
+        # 只按本类型的上次补充时间补充令牌（不超过容量上限）
+        tokens = self.tokens.get(api_type, capacity)
+        last = self.last_refill.get(api_type, now)
+        tokens = min(capacity, tokens + max(0.0, now - last) * rate)
+
+        # 预扣令牌；不足 1 个时按欠额计算等待时间（欠额由后续补充偿还）
+        tokens -= 1
+        self.tokens[api_type] = tokens
+        self.last_refill[api_type] = now
+        if tokens < 0:
+            return -tokens / rate
+        return 0.0
+
+    def wait_time(self, api_type: str, now: Optional[float] = None) -> float:
+        """
+        不扣令牌，估算本 AK 现在为 api_type 发出下一个请求最早还要等多久（含配额错误的暂停）；
+        已分配给任务、尚未取令牌的请求（pending）按已占用计算
+        """
+        if now is None:
+            now = time.monotonic()
+        rate = float(self.rate.get(api_type, 3))
+        capacity = float(self.capacity.get(api_type, 3))
+        tokens = self.tokens.get(api_type, capacity)
+        tokens = min(capacity, tokens + max(0.0, now - self.last_refill.get(api_type, now)) * rate)
+        tokens -= self.pending.get(api_type, 0)
+        token_wait = (1.0 - tokens) / rate if tokens < 1 else 0.0
+        return max(token_wait, self.blocked_until.get(api_type, 0.0) - now)
+
+    def claim(self, api_type: str):
+        """AKDispatcher 把一个任务分配给本 AK：只计入 pending，令牌等任务真正请求时由 acquire 扣"""
+        self.pending[api_type] = self.pending.get(api_type, 0) + 1
+
+    def release(self, api_type: str):
+        """分配的任务没有请求（缓存命中 / 合并到在途请求）就结束了，撤销 pending"""
+        if self.pending.get(api_type, 0) > 0:
+            self.pending[api_type] -= 1
+
+    def back_off(self, api_type: str):
+        """配额类错误：暂停本 AK 的该类请求，连续出错时暂停时长翻倍"""
+        n = self.failures.get(api_type, 0)
+        self.failures[api_type] = n + 1
+        self.blocked_until[api_type] = time.monotonic() + min(AK_MAX_BACKOFF_S, AK_BACKOFF_S * (2 ** n))
+        print(f"[AK] {self.ak} 的 {api_type} 暂停调度 {self.blocked_until[api_type] - time.monotonic():.0f}s")
+
+    def recover(self, api_type: str):
+        """请求成功，清除连续错误计数"""
+        if self.failures.pop(api_type, None) is not None:
+            self.blocked_until.pop(api_type, None)
 
     # ------------------------
     # 初始化 aiohttp 会话
     # ------------------------
     async def _ensure_session(self):
-        # 如果 session 不存在或已关闭，则重新创建
-        if self.session is None or self.session.closed:
+        # session 不存在、已关闭或属于其他事件循环时重新创建
+        if self.session is None or self.session.closed or self.session_loop is not asyncio.get_running_loop():
             await self.start()
-        if self.lock is None:
-            self.lock = asyncio.Lock()
 
     # ------------------------
     # 异步请求
     # ------------------------
     async def fetch_async(self, url: str, params: Dict, api_type: str):
+        """
+        发起请求。USE_SINGLE_FLIGHT 开启时，与在途请求 URL + 参数（不含 ak）相同的调用直接等待那次请求的结果，
+        不再消耗配额；返回的字典由所有合并的调用方共享，调用方只读不改。
+        """
+        if not USE_SINGLE_FLIGHT:
+            return await self._fetch_async(url, params, api_type)
+        return await _single_flight.do(request_key(url, params),
+                                       lambda: self._fetch_async(url, params, api_type))
+
+    async def _fetch_async(self, url: str, params: Dict, api_type: str):
+        """
+        实际发起请求。只有取令牌时短暂持锁，HTTP 请求与退避等待都在锁外，
+        同一 AK 上可以有多个请求同时在途（速率由令牌桶约束）；每次重试也要重新取令牌。
+        """
         await self._ensure_session()
-        async with self.lock:
-            await self.acquire(api_type=api_type)
+        params["ak"] = self.ak
 
-            params["ak"] = self.ak
+        for i in range(MAX_RETRIES):
+            await self.acquire(api_type=api_type)
+            try:
+                async with self.session.get(url, params=params) as resp:
+                    text = await resp.text()
+                    data = json.loads(text)
+                    if isinstance(data, dict) and data.get("status") != 0:
+                        raise BaiduAPIError(status=data.get("status"), message=data.get("message", ""), response=data,
+                                            ak=self)
+                    return data
 
-            for i in range(MAX_RETRIES):
-                try:
-                    async with self.session.get(url, params=params) as resp:
-                        text = await resp.text()
-                        data = json.loads(text)
-                        if isinstance(data, dict) and data.get("status") != 0:
-                            raise BaiduAPIError(status=data.get("status"), message=data.get("message", ""), response=data)
-                        return data
+            except BaiduAPIError as e:
+                print(f"[BaiduAPI] 业务错误: status={e.status}, message={e.message}")
+                # 配额类状态码原地重试无意义，交给调用方（AKDispatcher）换 AK
+                if e.status in QUOTA_ERROR_STATUS:
+                    raise
+                if i == MAX_RETRIES - 1:
+                    print("重试失败，放弃该请求")
+                    return None
+                print(params)
+                await asyncio.sleep(0.5 * (2 ** i))  # 指数退避
+                print("重试中第 {} 次...".format(i + 1))
+                continue
 
-                except BaiduAPIError as e:
-                    print(f"[BaiduAPI] 业务错误: status={e.status}, message={e.message}")
-                    # 百度的部分状态码不适合重试
-                    if e.status in (302, 301, 4, 5):
-                        raise
-                    if i == MAX_RETRIES - 1:
-                        print("重试失败，放弃该请求")
-                        return None
-                    print(params)
-                    await asyncio.sleep(0.5 * (2 ** i))  # 指数退避
-                    print("重试中第 {} 次...".format(i + 1))
-                    continue
-
-                except (asyncio.TimeoutError, ClientConnectionError, ClientError) as e:
-                    print(f"[BaiduAPI] 请求异常: {type(e).__name__}, message={e}")
-                    if i == MAX_RETRIES - 1:
-                        print("重试失败，放弃该请求")
-                        return None
-                    await asyncio.sleep(0.5 * (2 ** i))  # 指数退避
+            except (asyncio.TimeoutError, ClientConnectionError, ClientError) as e:
+                print(f"[BaiduAPI] 请求异常: {type(e).__name__}, message={e}")
+                if i == MAX_RETRIES - 1:
+                    print("重试失败，放弃该请求")
+                    return None
+                await asyncio.sleep(0.5 * (2 ** i))  # 指数退避
 
-                except Exception as e:
-                    print(f"[BaiduAPI] 未知异常: {type(e).__name__}, message={e}")
-                    if i == MAX_RETRIES - 1:
-                        print("重试失败，放弃该请求")
-                        return None
-                    await asyncio.sleep(0.5 * (2 ** i))  # 指数退避
+            except Exception as e:
+                print(f"[BaiduAPI] 未知异常: {type(e).__name__}, message={e}")
+                if i == MAX_RETRIES - 1:
+                    print("重试失败，放弃该请求")
+                    return None
+                await asyncio.sleep(0.5 * (2 ** i))  # 指数退避
 
     # ------------------------
     # 同步请求版本（备用）
     # ------------------------
     def fetch(self, url: str, params: Dict):
+        """同步请求；USE_SINGLE_FLIGHT 开启时与其他线程的相同在途请求合并"""
+        if not USE_SINGLE_FLIGHT:
+            return self._fetch(url, params)
+        return _sync_single_flight.do(request_key(url, params), lambda: self._fetch(url, params))
+
+    def _fetch(self, url: str, params: Dict):
         params["ak"] = self.ak
         for i in range(MAX_RETRIES):
             try:
@@ -150,7 +263,8 @@ class AK:
                 resp.raise_for_status()
                 data = resp.json()
                 if isinstance(data, dict) and data.get("status") != 0:
-                    raise BaiduAPIError(status=data.get("status"), message=data.get("message", ""), response=data)
+                    raise BaiduAPIError(status=data.get("status"), message=data.get("message", ""), response=data,
+                                        ak=self)
                 return data
             except (requests.RequestException, ValueError, BaiduAPIError) as e:
                 print(f"[BaiduAPI] 同步请求错误: {e}")
@@ -158,3 +272,90 @@ class AK:
                     print("重试失败，放弃该请求")
                     return None
                 time.sleep(0.5 * (2 ** i))
+
+
+class AKDispatcher:
+    """
+    跨 AK 的请求调度：任务放进共享队列，若干 worker 依次取任务，每次把请求交给
+    “对该 api_type 最早能发出请求”的 AK（看各 AK 自己的令牌桶与暂停状态），而不是创建任务时就轮询绑定 AK。
+    AK 返回配额类错误（QUOTA_ERROR_STATUS）时暂停该 AK 并把任务放回队列由其他 AK 重试；
+    经 single-flight 收到别的 AK 的配额错误时只重新排队，不暂停自己的 AK。
+    分配 AK 时只登记 pending，令牌在任务真正发请求（acquire）时才扣，缓存命中的任务不排队、不耗配额。
+    总吞吐趋近所有 AK 该类 QPS 之和，不受最慢 / 出错的 AK 拖累。
+    """
+
+    def __init__(self, aks: Sequence[AK]):
+        if not aks:
+            raise ValueError("AKDispatcher 至少需要一个 AK")
+        self.aks = list(aks)
+
+    def pick(self, api_type: str) -> AK:
+        """选出最早可用的 AK 并登记一个待请求任务（不扣令牌、不等待，见 AK.claim）"""
+        now = time.monotonic()
+        ak = min(self.aks, key=lambda a: a.wait_time(api_type, now))
+        ak.claim(api_type)
+        return ak
+
+    def total_qps(self, api_type: str) -> int:
+        return sum(ak.get_qps_limit(api_type) for ak in self.aks)
+
+    async def run(self, api_type: str, jobs: Sequence[Any],
+                  call: Callable[[Any, AK], Awaitable[Any]],
+                  concurrency: Optional[int] = None) -> List[Any]:
+        """
+        对每个 job 执行 await call(job, ak)，返回与 jobs 同序的结果列表；
+        失败的任务对应位置为异常对象（与 asyncio.gather(return_exceptions=True) 一致）。
+        concurrency: 同时在途的请求数，默认 所有 AK 的 QPS 之和 × DISPATCH_INFLIGHT_PER_QPS
+        """
+        results: List[Any] = [None] * len(jobs)
+        async for idx, result in self.iter_results(api_type, jobs, call, concurrency):
+            results[idx] = result
+        return results
+
+    async def iter_results(self, api_type: str, jobs: Sequence[Any],
+                           call: Callable[[Any, AK], Awaitable[Any]],
+                           concurrency: Optional[int] = None) -> AsyncIterator[Tuple[Any, Any]]:
+        """与 run 相同，但按完成顺序逐个产出 (job 下标, 结果或异常)；提前退出迭代时取消未完成的请求"""
+        queue: asyncio.Queue = asyncio.Queue()
+        done: asyncio.Queue = asyncio.Queue()
+        for idx, job in enumerate(jobs):
+            queue.put_nowait((idx, job, 0))
+        if concurrency is None:
+            concurrency = self.total_qps(api_type) * DISPATCH_INFLIGHT_PER_QPS
+        concurrency = max(1, min(concurrency, len(jobs)))
+
+        async def worker():
+            while not queue.empty():
+                idx, job, attempt = queue.get_nowait()
+                ak = self.pick(api_type)
+                slot = [ak, api_type, False]
+                token = _dispatch_slot.set(slot)
+                try:
+                    # 令牌在 call 内部真正请求时（fetch_async → acquire）才扣，缓存命中的任务不等待也不耗配额
+                    result = await call(job, ak)
+                    ak.recover(api_type)
+                except BaiduAPIError as e:
+                    if e.status in QUOTA_ERROR_STATUS:
+                        # 只暂停真正收到该状态的 AK；合并到别人请求（single-flight）得到的错误不算本 AK 的
+                        if e.ak is ak and slot[2]:
+                            ak.back_off(api_type)
+                        if attempt + 1 < len(self.aks):
+                            queue.put_nowait((idx, job, attempt + 1))   # 换其他 AK 重试
+                            continue
+                    result = e
+                except Exception as e:
+                    result = e
+                finally:
+                    _dispatch_slot.reset(token)
+                    if not slot[2]:
+                        ak.release(api_type)
+                done.put_nowait((idx, result))
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        try:
+            for _ in range(len(jobs)):
+                yield await done.get()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
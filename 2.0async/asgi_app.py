@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+asgi_app.py
+
+/plan 的 ASGI 版本（Quart，路由、表单与模板与 web_app 相同）。
+处理函数在服务器的事件循环中直接 await 百度请求，等待 I/O 时同一进程可以并发处理多个规划；
+数据库与 CPU 计算由 plan_service 放到线程池。AK 会话在该循环中创建并一直复用，停服时关闭。
+
+运行：hypercorn asgi_app:app --bind 0.0.0.0:5000
+  或：uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import logging
+from quart import Quart, request, render_template, jsonify, make_response, url_for
+from config import QPS_MATRIX
+from db import session as db_session
+from ak_manner import AK
+from plan_service import plan_trip_async, parse_plan_form, result_page_context
+from plan_jobs import (PlanJobManager, JOB_NOT_FOUND, SSE_HEADERS, job_links, parse_since, resume_from,
+                       sse_stream_async)
+
+app = Quart(__name__, static_folder="static", template_folder="templates")
+logging.basicConfig(level=logging.INFO)
+db_session.init_db(create_sample=False)
+aks = [AK(item["ak"], item["limits"]) for item in QPS_MATRIX]
+jobs = PlanJobManager(aks)
+
+
+@app.before_serving
+async def bind_job_loop():
+    # 任务与请求共用服务器的事件循环（AK 会话绑定在该循环上）
+    jobs.loop = asyncio.get_running_loop()
+
+
+@app.after_serving
+async def close_sessions():
+    await AK.close_all()
+
+
+@app.route("/", methods=["GET"])
+async def index():
+    return await render_template("index.html")
+
+
+@app.route("/plan", methods=["POST"])
+async def plan():
+    try:
+        origin, destination, brand, start_soc = parse_plan_form(await request.form)
+
+        result = await plan_trip_async(origin, destination, brand, start_soc, aks)
+
+        return await render_template("result.html", **result_page_context(result))
+
+    except Exception as e:
+        logging.exception("处理 /plan 时出错")
+        return await render_template("error.html", message=str(e)), 500
+
+
+# =========================
+# 任务模式（与 web_app 相同的接口）
+# =========================
+@app.route("/plan/jobs", methods=["POST"])
+async def submit_plan_job():
+    try:
+        origin, destination, brand, start_soc = parse_plan_form(await request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job = jobs.submit(origin, destination, brand, start_soc)
+    return jsonify(job_links(job, url_for)), 202
+
+
+@app.route("/plan/jobs/<job_id>", methods=["GET"])
+async def plan_job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify(JOB_NOT_FOUND), 404
+    return jsonify(job.snapshot(parse_since(request.args.get("since"))))
+
+
+@app.route("/plan/jobs/<job_id>/events", methods=["GET"])
+async def plan_job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify(JOB_NOT_FOUND), 404
+    since = resume_from(request.headers.get("Last-Event-ID"), request.args.get("since"))
+    # 在事件循环上等待进度事件，不占用线程池（线程池留给规划计算与数据库）
+    response = await make_response(sse_stream_async(job, since), SSE_HEADERS)
+    response.mimetype = "text/event-stream"
+    response.timeout = None
+    return response
+
+
+@app.route("/plan/jobs/<job_id>/result", methods=["GET"])
+async def plan_job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify(JOB_NOT_FOUND), 404
+    if job.status == "error":
+        return await render_template("error.html", message=job.error), 500
+    if not job.done:
+        return jsonify(job.snapshot()), 202
+    return await render_template("result.html", **result_page_context(job.result))
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+async_runtime.py
+
+进程内常驻的后台事件循环（独立守护线程），供同步的 Flask 代码提交协程：
+
+- run_sync(coro, timeout=None)：把协程提交到后台循环并阻塞等待结果
+- 各 AK 的 aiohttp 会话在后台循环里创建后一直复用（keep-alive 连接池 + DNS 缓存），
+  不再每个请求阶段都 asyncio.run 新建循环、建会话、握手、再关闭
+- 进程退出时（atexit）关闭所有 AK 会话并停止循环
+"""
+import asyncio
+import atexit
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Optional
+from ak_manner import AK
+
+
+class AsyncRuntime:
+    def __init__(self, name: str = "ev-async-runtime"):
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """启动后台循环（已启动则直接返回）"""
+        with self.lock:
+            if self.loop is not None and self.thread is not None and self.thread.is_alive():
+                return self.loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self.thread = threading.Thread(target=_run, name=self.name, daemon=True)
+            self.thread.start()
+            ready.wait()
+            self.loop = loop
+            return loop
+
+    def in_loop_thread(self) -> bool:
+        return self.thread is not None and threading.current_thread() is self.thread
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """在后台循环中执行协程并等待结果；超时抛出 TimeoutError 并取消该协程"""
+        if self.in_loop_thread():
+            raise RuntimeError("不能在后台事件循环线程内同步等待协程，请直接 await")
+        future = asyncio.run_coroutine_threadsafe(coro, self.start())
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"协程执行超过 {timeout}s")
+
+    def stop(self, timeout: float = 5.0):
+        """关闭所有 AK 会话并停止循环"""
+        with self.lock:
+            loop, thread = self.loop, self.thread
+            self.loop = self.thread = None
+        if loop is None or thread is None or not thread.is_alive():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(AK.close_all(), loop).result(timeout)
+        except Exception as e:
+            print(f"[async_runtime] 关闭会话失败: {type(e).__name__}: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+
+
+_runtime: Optional[AsyncRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> AsyncRuntime:
+    """进程内共享的后台循环（首次调用时启动，并注册退出时清理）"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = AsyncRuntime()
+            _runtime.start()
+            atexit.register(_runtime.stop)
+    return _runtime
+
+
+def run_sync(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """同步代码的入口：在共享后台循环中执行协程并返回结果"""
+    return get_runtime().run(coro, timeout)
@@ -17,11 +17,12 @@ baidu_api.py
     start: 起点坐标 (lat, lng)
     end: 终点坐标 (lat, lng)
     ak: 百度地图API密钥
-- get_route_polyline(start, end, ak) → Optional[Dict[str, Any]]
+- get_route_polyline(start, end, ak, tactics) → Optional[Dict[str, Any]]
 参数说明：
     start: 起点坐标 (lat, lng)
     end: 终点坐标 (lat, lng)
     ak: 百度地图API密钥
+    tactics: 路线偏好（可选），与起终点一起作为路线缓存的键
 - search_stations_by_circle(query, center, radius_m, ak, ...) → List[Dict[str, Any]]
 参数说明：
     query: 搜索关键词
@@ -60,6 +61,10 @@ from typing import List, Optional, Tuple, Dict, Any
 from time import sleep
 from utils import Coord, corridor_polygon, polygon_to_bounds_str
 from ak_manner import AK
+from route_cache import get_route_cache
+from station_cache import get_station_cache
+from region_cache import get_region_cache
+from geocode_cache import get_geocode_cache
 
 # -------------------- API 封装 --------------------
 DRIVE_URL = "https://api.map.baidu.com/directionlite/v1/driving"
@@ -67,6 +72,7 @@ PLACE_URL = "https://api.map.baidu.com/place/v2/search"
 DISTANCE_URL = "https://api.map.baidu.com/routematrix/v2/driving"
 GEOCODE_URL = "https://api.map.baidu.com/geocoding/v3/"
 REVERSE_GEOCODE_URL = "https://api.map.baidu.com/reverse_geocoding/v3/"
+AREA_STATION_LIMIT = 5      # search_stations_in_area 默认返回的站点数
 
 
 # ---------- helpers ----------
@@ -76,6 +82,12 @@ def _fmt_coord_bd09(lat: float, lng: float) -> str:
 
 
 def geocode(address, ak: AK) -> Optional[Coord]:
+    """地址 → (lat, lng)（先查 geocode_cache），失败返回 None"""
+    cache = get_geocode_cache()
+    if cache is not None:
+        coord = cache.get(address)
+        if coord is not None:
+            return coord
     params = {
         "address": address,
         "output": "json",
@@ -85,12 +97,40 @@ def geocode(address, ak: AK) -> Optional[Coord]:
     data = ak.fetch(GEOCODE_URL, params)
     if isinstance(data, dict) and data.get("status") == 0:
         loc = data["result"]["location"]
+        if cache is not None:
+            cache.put(address, (loc["lat"], loc["lng"]))
+        return (loc["lat"], loc["lng"])
+    return None
+
+
+async def geocode_async(address: str, ak: AK) -> Optional[Coord]:
+    """geocode 的协程版本：地址 → (lat, lng)（先查 geocode_cache，SQLite 读写放到线程池），失败返回 None"""
+    cache = await asyncio.to_thread(get_geocode_cache)
+    if cache is not None:
+        coord = await asyncio.to_thread(cache.get, address)
+        if coord is not None:
+            return coord
+    params = {
+        "address": address,
+        "output": "json",
+        "ak": ak.get_ak(),
+    }
+    data = await ak.fetch_async(GEOCODE_URL, params, api_type="geocoding")
+    if isinstance(data, dict) and data.get("status") == 0:
+        loc = data["result"]["location"]
+        if cache is not None:
+            await asyncio.to_thread(cache.put, address, (loc["lat"], loc["lng"]))
         return (loc["lat"], loc["lng"])
     return None
 
 
 async def get_area(lat: float, lng: float, ak: AK) -> str:
-    """逆地理编码：坐标 → 行政区/城市"""
+    """逆地理编码：坐标 → 行政区/城市（先经 region_cache 本地判定，判定不了才请求 regeo）"""
+    cache = get_region_cache()
+    if cache is not None:
+        area = cache.lookup(lat, lng)
+        if area is not None:
+            return area
     params = {
         "ak": ak.get_ak(),
         "output": "json",
@@ -100,7 +140,10 @@ async def get_area(lat: float, lng: float, ak: AK) -> str:
     resp = await ak.fetch_async(REVERSE_GEOCODE_URL, params, api_type="regeo")
     if isinstance(resp, dict) and resp.get("status") == 0:
         comp = resp["result"]["addressComponent"]
-        return comp.get("district") or comp.get("city")
+        area = comp.get("district") or comp.get("city")
+        if cache is not None:
+            cache.record(lat, lng, area, comp.get("province", "") + comp.get("city", ""))
+        return area
     return None
 
 
@@ -117,23 +160,31 @@ def get_distance(start: Coord, end: Coord, ak: AK) -> Optional[float]:
             return results[0]["distance"]["value"] / 1000.0
     return None
 
-async def get_route_polyline(start: Coord, end: Coord, ak: AK) -> Optional[Dict[str, Any]]:
+async def get_route_polyline(start: Coord, end: Coord, ak: AK, tactics: Optional[int] = None) -> Optional[Dict[str, Any]]:
     """
-    获取驾车路线，返回：
+    获取驾车路线（先查 route_cache，命中则不发请求），返回：
     {
         "polyline": [(lat,lng), ...],
         "poly_start": [],
         "poly_end": [],
         "poly_name": [],
         "poly_distance": [],
-        "raw": 原始返回
+        "raw": 原始返回（只在实际请求时有；route_cache 不保存，命中时没有）
     }
     """
+    cache = get_route_cache()
+    if cache is not None:
+        cached = cache.get(start, end, tactics)
+        if cached is not None:
+            return cached
+
     params = {
         "origin": _fmt_coord_bd09(*start),
         "destination": _fmt_coord_bd09(*end),
         "ak": ak.get_ak(),
     }
+    if tactics is not None:
+        params["tactics"] = tactics
     data = await ak.fetch_async(DRIVE_URL, params, api_type="driving_plan")
     if isinstance(data, dict) and data.get("status") == 0:
         routes = data.get("result", {}).get("routes", [])       
@@ -155,7 +206,7 @@ async def get_route_polyline(start: Coord, end: Coord, ak: AK) -> Optional[Dict[
                     continue
             poly_end.append(len(poly) - 1)
 
-        return {
+        result = {
             "polyline": poly,
             "poly_start": poly_start,
             "poly_end": poly_end,
@@ -163,6 +214,9 @@ async def get_route_polyline(start: Coord, end: Coord, ak: AK) -> Optional[Dict[
             "poly_distance": poly_distance,
             "raw": data
         }
+        if cache is not None:
+            cache.put(start, end, result, tactics)
+        return result
     return None
 
 async def get_distances_async(origin: str, destinations: List[str], ak: AK) -> List[List[float]]:
@@ -194,7 +248,34 @@ async def get_distances_async(origin: str, destinations: List[str], ak: AK) -> L
     return []
 
 
-async def search_stations_in_area(lat: float, lng: float, ak: AK, page_size: int = 10, page_num : int = 0, region: Optional[str] = None,limit = 5) -> List[Dict]:
+async def get_distance_block_async(origins: List[Coord], destinations: List[Coord], ak: AK) -> Optional[List[List[float]]]:
+    """
+    一次批量算路请求计算 origins × destinations 的驾车距离（公里），返回 [起点][终点] 的二维列表；
+    无法到达的点对为 inf，请求失败返回 None。起点数 × 终点数 不得超过 ROUTE_MATRIX_MAX_ELEMENTS。
+    """
+    if not origins or not destinations:
+        return [[] for _ in origins]
+    params = {
+        "origins": "|".join([_fmt_coord_bd09(*pt) for pt in origins]),
+        "destinations": "|".join([_fmt_coord_bd09(*pt) for pt in destinations]),
+        "tactics": 11,  # 最短时间
+        "output": "json",
+        "ak": ak.get_ak()
+    }
+    data = await ak.fetch_async(url=DISTANCE_URL, params=params, api_type="distance_matrix")
+    if not data or data.get("status") != 0:
+        return None
+    results = data.get("result", [])
+    if len(results) != len(origins) * len(destinations):
+        print(f"[BaiduAPI] 批量算路结果数量不符: 期望 {len(origins) * len(destinations)}, 实际 {len(results)}")
+        return None
+    # 结果按 起点优先 的顺序排列
+    flat = [res["distance"]["value"] / 1000.0 if "distance" in res else float('inf') for res in results]
+    m = len(destinations)
+    return [flat[r * m:(r + 1) * m] for r in range(len(origins))]
+
+
+async def search_stations_in_area(lat: float, lng: float, ak: AK, page_size: int = 10, page_num : int = 0, region: Optional[str] = None,limit = AREA_STATION_LIMIT) -> List[Dict]:
     """
     查询某个点所在行政区域的充电站列表
     :param lat: 纬度
@@ -204,7 +285,14 @@ async def search_stations_in_area(lat: float, lng: float, ak: AK, page_size: int
     :param page_num: 页码，从0开始
     :param region: 可选，指定行政区名称，若不提供则自动获取
     :return: 充电站列表
+    首页查询先查 station_cache（StationTileCache.lookup）：查询点所在 geohash 格子已有完整搜索结果（覆盖），
+    或格子内已知站点（含预热载入的）不少于 limit 个时直接返回，不再逆地理编码和搜索
     """
+    cache = get_station_cache() if page_num == 0 else None
+    if cache is not None:
+        cached = cache.lookup(lat, lng, limit)
+        if cached is not None:
+            return cached
 
     if(not region):
         region = await get_area(lat, lng, ak)
@@ -236,4 +324,6 @@ async def search_stations_in_area(lat: float, lng: float, ak: AK, page_size: int
             "uid": poi.get("uid")
         })
 
+    if cache is not None:
+        cache.put(lat, lng, results)
     return results[:limit]
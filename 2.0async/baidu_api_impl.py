@@ -6,74 +6,175 @@ baidu_api.py
 - search_stations_along_route(route_poly, ak, ...): 按段分配配额、分页请求、扩半径、去重与下采样
 """
 import math
-from baidu_api import get_route_polyline, search_stations_in_area, get_distances_async
-from typing import Dict, List, Optional, Tuple
+from baidu_api import get_route_polyline, search_stations_in_area, get_distance_block_async, get_area, geocode_async, AREA_STATION_LIMIT
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import asyncio
 from utils import haversine_km
-from ak_manner import AK
+from ak_manner import AK, AKDispatcher
+from async_runtime import run_sync
+from distance_cache import get_pair_cache
+from station_cache import get_station_cache
+from config import REGION_FILL_MAX_KM, ROUTE_MATRIX_MAX_ELEMENTS, ROUTE_MATRIX_PACK_WINDOW
 
 Coord = Tuple[float, float]
 
 
 def close_ak_sessions(aks: List[AK]):
-    """关闭所有 AK 的会话"""
+    """关闭所有 AK 的会话（会话由常驻后台循环持有，平时无需调用，进程退出时会自动关闭）"""
     async def _close_all():
-        tasks = []
-        for ak in aks:
-            tasks.append(asyncio.create_task(ak.close()))
-        await asyncio.gather(*tasks)
+        await asyncio.gather(*[ak.close() for ak in aks])
 
-    asyncio.run(_close_all())
+    run_sync(_close_all())
+
+async def geocode_many(addresses: List[str], aks: List[AK]) -> List[Optional[Coord]]:
+    """并发地理编码多个地址（经调度器分配到各 AK，先查 geocode_cache），失败的地址对应 None"""
+    res = await AKDispatcher(aks).run("geocoding", addresses, geocode_async)
+    return [None if isinstance(c, Exception) else c for c in res]
 
 # =========================
 # 批量请求函数
 # =========================
 
+def matrix_pairs(to_lists: List[List[int]], symmetric: bool) -> List[Tuple[int, int]]:
+    """to_lists 展开为去重的点对；symmetric 时 (i, j) 与 (j, i) 只保留 i<j 一个方向"""
+    pairs = []
+    for i, lst in enumerate(to_lists):
+        for j in lst:
+            if i == j and symmetric:
+                continue
+            pairs.append((min(i, j), max(i, j)) if symmetric else (i, j))
+    return list(dict.fromkeys(pairs))
+
+
+def plan_matrix_batches(pairs: List[Tuple[int, int]],
+                        max_elements: int = ROUTE_MATRIX_MAX_ELEMENTS,
+                        window: int = ROUTE_MATRIX_PACK_WINDOW) -> List[Tuple[List[int], List[int]]]:
+    """
+    把需要的 (起点, 终点) 点对打包成批量算路请求，返回 [(起点下标列表, 终点下标列表), ...]，
+    每个请求计算两组的笛卡尔积，起点数 × 终点数 ≤ max_elements。
+    1. 每个起点的终点按 max_elements 个一批整块发出（单起点满载）；
+    2. 剩下不足一批的短行按首个终点排序，贪心合并终点集合相近的起点：
+       每次在后续 window 行中挑选合并后矩形最小且不超限的一行，直到放不下为止。
+    请求数下界为 ceil(点对数 / max_elements)。
+    """
+    rows: Dict[int, List[int]] = {}
+    for i, j in pairs:
+        rows.setdefault(i, []).append(j)
+
+    batches: List[Tuple[List[int], List[int]]] = []
+    rest: List[Tuple[int, List[int]]] = []
+    for i in sorted(rows):
+        dests = sorted(set(rows[i]))
+        full = len(dests) - len(dests) % max_elements
+        for start in range(0, full, max_elements):
+            batches.append(([i], dests[start:start + max_elements]))
+        if full < len(dests):
+            rest.append((i, dests[full:]))
+
+    rest.sort(key=lambda r: (r[1][0], r[0]))
+    taken = [False] * len(rest)
+    for head in range(len(rest)):
+        if taken[head]:
+            continue
+        taken[head] = True
+        block_origins = [rest[head][0]]
+        block_dests = set(rest[head][1])
+        while True:
+            best = None
+            for k in range(head + 1, min(len(rest), head + 1 + window)):
+                if taken[k]:
+                    continue
+                size = (len(block_origins) + 1) * len(block_dests.union(rest[k][1]))
+                if size <= max_elements and (best is None or size < best[0]):
+                    best = (size, k)
+            if best is None:
+                break
+            k = best[1]
+            taken[k] = True
+            block_origins.append(rest[k][0])
+            block_dests.update(rest[k][1])
+        batches.append((block_origins, sorted(block_dests)))
+    return batches
+
+
+async def get_pair_distances_async(
+    origins: List[Coord],
+    destinations: List[Coord],
+    pairs: List[Tuple[int, int]],
+    aks: List[AK],
+    symmetric: bool = False
+) -> Dict[Tuple[int, int], float]:
+    """
+    计算指定点对 (origins[i] → destinations[j]) 的驾车距离（km），返回 {(i, j): km}，请求失败的点对不在结果中。
+    先查持久化距离缓存（distance_cache），未命中的点对由 plan_matrix_batches 打包成尽量满载的批量算路请求，
+    成功结果回写缓存。请求块顺带算出的其他点对也一并返回。
+    缓存的 SQLite 读写放在线程池执行，不阻塞事件循环上的其他请求。
+    symmetric: origins 与 destinations 为同一组点，键统一为 (min, max)
+    """
+    found: Dict[Tuple[int, int], float] = {}
+
+    # 查缓存，未命中的点对留给网络请求
+    pending = pairs
+    cache = await asyncio.to_thread(get_pair_cache)
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get_many, [(origins[i], destinations[j]) for i, j in pairs])
+        pending = []
+        for i, j in pairs:
+            km = cached.get(cache.key(origins[i], destinations[j]))
+            if km is None:
+                pending.append((i, j))
+            else:
+                found[(i, j)] = km
+
+    batches = plan_matrix_batches(pending)
+    results = await AKDispatcher(aks).run(
+        "distance_matrix", batches,
+        lambda b, ak: get_distance_block_async([origins[i] for i in b[0]], [destinations[j] for j in b[1]], ak))
+
+    # 组装结果（请求失败的块跳过）
+    fresh = []
+    for (o_idx, d_idx), block in zip(batches, results):
+        if isinstance(block, Exception) or block is None:
+            continue
+        for i, row in zip(o_idx, block):
+            for j, dist in zip(d_idx, row):
+                if symmetric and i == j:
+                    continue
+                found[(min(i, j), max(i, j)) if symmetric else (i, j)] = dist
+                if dist is not None and dist != float('inf'):
+                    fresh.append((origins[i], destinations[j], dist))
+
+    print(f"[DEBUG] 批量算路: 需要 {len(pairs)} 对, 缓存未命中 {len(pending)} 对, 请求 {len(batches)} 次"
+          f"（下界 {-(-len(pending) // ROUTE_MATRIX_MAX_ELEMENTS)} 次）")
+    if cache is not None:
+        await asyncio.to_thread(cache.put_many, fresh)
+        print(f"[DEBUG] 距离缓存: 累计 {cache.stats()}")
+    return found
+
+
 async def get_distance_matrix_batched_async(
     origins: List[Coord],
     destinations: List[Coord],
     to_lists: List[List[int]],
-    aks: List[AK]
+    aks: List[AK],
+    symmetric: Optional[bool] = None
 ) -> List[List[Optional[float]]]:
-    """异步批量计算多个起点到多个终点的距离矩阵"""
-    tasks = []
-    task_meta = []  # [(origin_idx, dest_start_idx_in_to_lists, batch_size)]
-
-    ak_len = len(aks)
-    j = 0
-    ak = aks[j]
-
-    # 构建任务
-    for i, dest_idx_list in enumerate(to_lists):
-        dest_subset = [destinations[k] for k in dest_idx_list]
-        batch_size = ak.qps_limit["distance_get"]
-        for start in range(0, len(dest_subset), batch_size):
-            batch = dest_subset[start:start + batch_size]
-            tasks.append(get_distances_async(origins[i], batch, ak))
-            task_meta.append((i, start, len(batch)))
-            j = (j + 1) % ak_len
-            ak = aks[j]
-
-    # 等待所有任务完成
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    """异步批量计算多个起点到多个终点的距离矩阵（to_lists[i] 为起点 i 需要的终点下标，见 get_pair_distances_async）
+    symmetric: 是否把 i→j 与 j→i 视为同一距离（只请求一个方向，矩阵两处都填）；
+               默认在 origins 与 destinations 相同时开启
+    """
+    if symmetric is None:
+        symmetric = origins is destinations or origins == destinations
 
     # 初始化完整矩阵（None 填充）
     distance_matrix = [
         [None] * len(destinations) for _ in range(len(origins))
     ]
-
-    # 组装返回结果
-    for (i, start, batch_len), batch_result in zip(task_meta, results):
-        # 若任务异常或返回 None，则对应距离全设为 None
-        if isinstance(batch_result, Exception) or batch_result is None:
-            batch_result = [None] * batch_len
-
-        dest_idx_list = to_lists[i]
-        for offset, dist in enumerate(batch_result):
-            # 在完整 destinations 中的实际索引
-            dest_global_idx = dest_idx_list[start + offset]
-            distance_matrix[i][dest_global_idx] = dist
-
+    found = await get_pair_distances_async(origins, destinations, matrix_pairs(to_lists, symmetric), aks, symmetric)
+    for (i, j), km in found.items():
+        distance_matrix[i][j] = km
+        if symmetric:
+            distance_matrix[j][i] = km
     return distance_matrix
 
 
@@ -84,65 +185,128 @@ def get_distance_matrix_batched_async_start(
     to_lists: List[List[int]],
     aks: List[AK]
 ) -> List[List[Optional[float]]]:
-    """同步接口，启动异步距离矩阵计算"""
+    """同步接口，在常驻后台循环中执行异步距离矩阵计算"""
 
-    result = asyncio.run(get_distance_matrix_batched_async(
+    result = run_sync(get_distance_matrix_batched_async(
         origins,
         destinations,
         to_lists,
         aks
     ))
-    close_ak_sessions(aks)
     return result
 
-async def search_stations_along_route(
-        origin, 
-        destination, 
-        aks: List[AK], 
-        query_limit):
+async def resolve_areas_along(points: List[Coord], aks: List[AK]) -> List[Optional[str]]:
     """
-    沿路线搜索充电站
+    沿路采样点的行政区判定（二分）：先查两端，两端同区且沿途距离不超过 REGION_FILL_MAX_KM 时
+    中间点直接沿用该区，否则取中点递归；同一层的 regeo 并发发出。
+    regeo 次数约为 O(路线长度 / REGION_FILL_MAX_KM + 区界数 × log n)，而不是每个点一次。
+    """
+    n = len(points)
+    areas: List[Optional[str]] = [None] * n
+    if n == 0:
+        return areas
+    # 相邻采样点的累计沿途距离
+    cum = [0.0]
+    for i in range(1, n):
+        cum.append(cum[-1] + haversine_km(points[i - 1], points[i]))
+
+    async def resolve(idx_list: List[int]):
+        todo = [i for i in dict.fromkeys(idx_list) if areas[i] is None]
+        res = await AKDispatcher(aks).run("regeo", todo, lambda i, ak: get_area(points[i][0], points[i][1], ak))
+        for i, area in zip(todo, res):
+            areas[i] = None if isinstance(area, Exception) else area
+
+    spans = [(0, n - 1)]
+    await resolve([0, n - 1])
+    while spans:
+        nxt = []
+        for lo, hi in spans:
+            if hi - lo <= 1:
+                continue
+            if areas[lo] is not None and areas[lo] == areas[hi] and cum[hi] - cum[lo] <= REGION_FILL_MAX_KM:
+                for i in range(lo + 1, hi):
+                    areas[i] = areas[lo]
+                continue
+            mid = (lo + hi) // 2
+            nxt.extend([(lo, mid), (mid, hi)])
+        await resolve([mid for lo, mid in nxt[0::2]])
+        spans = nxt
+    return areas
+
+
+async def route_polyline_points(origin, destination, aks: List[AK]) -> List[Coord]:
+    """起终点间直达驾车路线的折线点 [(lat, lng), ...]，请求失败时为空列表"""
+    route_dict = await get_route_polyline(origin, destination, aks[0])
+    return [tuple(p) for p in (route_dict or {}).get("polyline", [])]
+
+
+async def iter_stations_along_route(
+        origin,
+        destination,
+        aks: List[AK],
+        query_limit,
+        poly: Optional[List[Coord]] = None) -> AsyncIterator[List[Dict]]:
+    """
+    沿路线搜索充电站（异步生成器）：每个搜索点的结果一返回就产出其中新出现的站点（按 uid 去重），
+    下游可以边收站点边请求距离，不必等全部搜索结束。
     :param origin: 起点坐标 (lat, lng)
     :param destination: 终点坐标 (lat, lng)
-    :param ak: 百度地图API密钥
+    :param aks: 百度地图 AK 列表
     :param query_limit: 搜索的最大请求数量
-    :return: 充电站列表
+    :param poly: 已取得的路线折线，不传时在这里请求
     """
     # 获取路线的折线点
-    print("2.1获取路线折线点")
-    route_dict = await get_route_polyline(origin, destination, aks[0])
-    #await aks[0].close()
-    poly = route_dict.get("polyline", [])
+    if poly is None:
+        print("2.1获取路线折线点")
+        poly = await route_polyline_points(origin, destination, aks)
     #按照点的数量划分为若干段，每段搜索一次，总数在query_limit以内
     query_points = []
     n = int(max(1, len(poly) / query_limit))
     for i in range(0, len(poly), n):
-        query_points.append(poly[i])
-    
-    stations = []
-    unique = {}
-    tasks = []
-    j = 0
-    ak_cnt = len(aks)
+        query_points.append(tuple(poly[i]))
+
+    unique = set()
     print(f"沿路线共划分为 {len(query_points)} 个搜索点")
     print("2.2开始沿路线搜索充电站")
-    for pt in query_points:
-        lat, lng = pt
-
-        tasks.append(asyncio.create_task(search_stations_in_area(lat, lng, aks[j])))
-        j = (j + 1) % ak_cnt
-
-    area_stations = await asyncio.gather(*tasks)
-
-    for area in area_stations:
+    # 格子缓存未命中的点才需要行政区，先批量二分判定，避免每个点各发一次 regeo
+    station_cache = get_station_cache()
+    cold_points = [pt for pt in query_points if station_cache is None or not station_cache.can_answer(*pt, AREA_STATION_LIMIT)]
+    regions = dict(zip(cold_points, await resolve_areas_along(cold_points, aks)))
+    async for _, area in AKDispatcher(aks).iter_results(
+            "place_search", query_points,
+            lambda pt, ak: search_stations_in_area(pt[0], pt[1], ak, region=regions.get(pt))):
+        if isinstance(area, Exception):
+            print(f"[WARN] 沿路搜索失败: {area}")
+            continue
+        fresh = []
         for st in area:
             uid = st.get("uid")
             if uid and uid not in unique:
-                unique[uid] = st
+                unique.add(uid)
+                fresh.append(st)
                 print(f"[DEBUG] 新增充电站: {st}")
-        stations = list(unique.values())
+        if fresh:
+            yield fresh
 
 
+async def search_stations_along_route(
+        origin, 
+        destination, 
+        aks: List[AK], 
+        query_limit,
+        poly: Optional[List[Coord]] = None):
+    """
+    沿路线搜索充电站（收集 iter_stations_along_route 的全部结果）
+    :param origin: 起点坐标 (lat, lng)
+    :param destination: 终点坐标 (lat, lng)
+    :param ak: 百度地图API密钥
+    :param query_limit: 搜索的最大请求数量
+    :param poly: 已取得的路线折线，不传时在 iter_stations_along_route 中请求
+    :return: 充电站列表
+    """
+    stations = []
+    async for batch in iter_stations_along_route(origin, destination, aks, query_limit, poly):
+        stations.extend(batch)
     print(f"沿路搜索到 {len(stations)} 个充电站")
     return stations
 
@@ -151,14 +315,13 @@ def search_stations_along_route_start(
         destination, 
         aks: List[AK], 
         query_limit):
-    """同步接口，启动异步沿路线搜索充电站"""
-    result = asyncio.run(search_stations_along_route(
+    """同步接口，在常驻后台循环中执行异步沿路线搜索充电站"""
+    result = run_sync(search_stations_along_route(
         origin, 
         destination, 
         aks, 
         query_limit
     ))
-    close_ak_sessions(aks)
     return result
 
 # =========================
@@ -182,12 +345,11 @@ def get_route_polyline_start(
     route_points: List[Dict],
     aks: List[AK]
 ) -> Dict:
-    """同步接口，启动异步获取驾车路线折线"""
-    result = asyncio.run(get_route_polyline_async(
+    """同步接口，在常驻后台循环中执行异步获取驾车路线折线"""
+    result = run_sync(get_route_polyline_async(
         route_points,
         aks
     ))
-    close_ak_sessions(aks)
     return result
 
 
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+规划引擎基准：在随机生成的走廊图上对比离散 SOC（不同步长、是否按需充电）与连续 SOC 规划的用时与结果精度。
+不依赖百度 API，直接运行：python bench_planner.py [节点数]
+"""
+import sys
+import time
+import random
+from typing import Dict, List, Tuple
+from utils import Coord, haversine_km
+from config import CAR, RANDOM_SEED
+import path_planner
+from csr_graph import CSRGraph
+
+
+def make_corridor_graph(n: int, max_range_km: float, length_deg: float = 3.0,
+                        width_deg: float = 0.3, detour: float = 1.2) -> Tuple[List[Coord], Dict[int, List[Tuple[int, float]]]]:
+    """沿纬线生成 n 个点（首尾为起终点），直线距离 * detour 作为“导航距离”，超出续航的边不连"""
+    rng = random.Random(RANDOM_SEED)
+    lat0, lng0 = 39.0, 117.0
+    points: List[Coord] = [(lat0, lng0)]
+    for _ in range(n - 2):
+        points.append((lat0 + rng.uniform(-width_deg, width_deg), lng0 + rng.uniform(0.0, length_deg)))
+    points.append((lat0, lng0 + length_deg))
+    adj: Dict[int, List[Tuple[int, float]]] = {i: [] for i in range(n)}
+    for i in range(n):
+        for j in range(i + 1, n):
+            d = haversine_km(points[i], points[j]) * detour
+            if d <= max_range_km:
+                adj[i].append((j, d))
+                adj[j].append((i, d))
+    return points, adj
+
+
+def run_case(name: str, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    dt = time.perf_counter() - t0
+    if not res:
+        print(f"{name:<28} 无可行路径  {dt * 1000:>9.1f} ms")
+        return None
+    st = res["stats"]
+    print(f"{name:<28} 总用时 {res['total_time_min']:>8.2f} min  "
+          f"扩展 {st['expanded_states']:>7}  入队 {st['pushed_states']:>8}  {dt * 1000:>9.1f} ms")
+    return res
+
+
+def main(n: int = 300, start_soc: int = 70):
+    car = dict(CAR)
+    points, adj = make_corridor_graph(n, car["max_range_km"])
+    s, t = 0, n - 1
+    print(f"节点数 {n}  边数 {sum(len(v) for v in adj.values()) // 2}  起始 SOC {start_soc}%")
+    for step in (10, 5, 2, 1):
+        run_case(f"discrete step={step}%", path_planner.dijkstra_ev, points, adj, car, s, t,
+                 start_soc=start_soc, step=step)
+    for step in (5, 1):
+        run_case(f"discrete lazy step={step}%", path_planner.dijkstra_ev, points, adj, car, s, t,
+                 start_soc=start_soc, step=step, lazy_charge=True)
+    run_case("continuous", path_planner.label_setting_ev, points, adj, car, s, t, start_soc=start_soc)
+
+    # 同一张图的 CSR 版本
+    csr = CSRGraph.from_adj(adj, n)
+    dict_bytes = sum(sys.getsizeof(lst) + sum(sys.getsizeof(e) + sys.getsizeof(e[1]) for e in lst)
+                     for lst in adj.values())
+    print(f"邻接表内存: dict {dict_bytes / csr.num_edges:.1f} B/边  CSR {csr.nbytes() / csr.num_edges:.1f} B/边")
+    run_case("discrete step=5% (CSR)", path_planner.dijkstra_ev, points, csr, car, s, t, start_soc=start_soc, step=5)
+    run_case("continuous (CSR)", path_planner.label_setting_ev, points, csr, car, s, t, start_soc=start_soc)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)
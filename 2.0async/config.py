@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 """全局配置：百度 AK、车辆参数、算法参数"""
+import os
 USE_BAIDU_DIS = True            # True 用百度获取距离；False 用文件
 USE_BAIDU_ROUTE = True          # True 用百度路线规划距离；False 用直线距离
 USE_BAIDU_POI = True           # True 用百度周边 POI 搜索充电站；False 用文件
@@ -19,15 +20,65 @@ CAR["max_range_km"] = CAR["battery_kwh"] / CAR["consumption_kwh_per_km"]
 STATION_POWER_KW = 120.0          # 充电桩功率 kW（用于充电时间估计）
 
 # ===== 筛选与图参数 =====
+USE_CSR_GRAPH = True         # True: 构图结果以 CSR（offsets/targets/weights 数组）存储，规划时直接遍历
 
 
 # ===== A* / 状态空间 =====
 CHARGE_PERCENT_STEP = 5      # 电量离散步长（%）。减小更精细，状态更多
 A_STAR_EPS_HEURISTIC = 1.0   # 启发式放大系数（>1 更激进，剪枝更多）
+USE_A_STAR = True            # True: A*（直线距离+最少充电时间下界）；False: 纯 Dijkstra
+USE_SOC_DOMINANCE = True     # True: 同节点“更慢且电量更低”的状态不入队（Pareto 支配剪枝）
+USE_LAZY_CHARGE = False      # True: dijkstra_ev 只生成“刚好够走某条出边”与充满的充电后继（近似，更快）
+PLANNER_ENGINE = "discrete"  # "discrete": 离散 SOC 的 dijkstra_ev；"continuous": 连续 SOC 标签设定 label_setting_ev
 
 # ===== Spanner 稀疏化 =====
 USE_SPARSIFICATION = 0       # 1:启用 Greedy-Spanner 稀疏化, -1: 启用 KNN 稀疏化, 0:不稀疏化
 SPANNER_EPSILON = 0.2        # (1+ε) 近似阈值；越小越保边
+SPANNER_KNN_K = 12           # Spanner 候选边只取每点 k 近邻 + Delaunay 边，(1+ε) 只对候选边成立；None 为完全图（任意点对 (1+ε)，但 O(n³ log n)）
+
+# ===== 缓存 =====
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".cache")
+CACHE_CLEANUP_EVERY = 32                                           # 路线 / 规划结果缓存每写入这么多次清理一次过期 / 超量文件
+USE_DIST_CACHE = True                                              # 站点对驾车距离持久化缓存
+DIST_CACHE_PATH = os.path.join(CACHE_DIR, "pair_distance.sqlite")  # SQLite 文件路径
+DIST_CACHE_TTL_S = 7 * 24 * 3600                                   # 条目有效期（秒）
+DIST_CACHE_MAX_ENTRIES = 500000                                    # 最大条目数，超出按最近访问时间淘汰
+DIST_CACHE_DECIMALS = 5                                            # 坐标取整位数（约 1 m）
+USE_ROUTE_CACHE = True                                             # 驾车路线（polyline）缓存：内存 LRU + 磁盘文件
+ROUTE_CACHE_DIR = CACHE_DIR                                        # 文件名 route_<md5>.json
+ROUTE_CACHE_TTL_S = 30 * 24 * 3600                                 # 条目有效期（秒）
+ROUTE_CACHE_MEMORY_ITEMS = 256                                     # 内存 LRU 条目数
+ROUTE_CACHE_DECIMALS = 5                                           # 坐标取整位数
+ROUTE_CACHE_MAX_FILES = 5000                                       # 磁盘上最多保留的路线文件数，超出删除最旧的
+USE_STATION_CACHE = True                                           # 充电站搜索结果按 geohash 格子缓存
+STATION_CACHE_PRECISION = 5                                        # geohash 精度（5 约 4.9km × 4.9km）
+STATION_CACHE_TTL_S = 24 * 3600                                    # 格子有效期（秒）
+STATION_CACHE_MAX_TILES = 4096                                     # 最多缓存格子数，超出按 LRU 淘汰
+STATION_CACHE_WARM_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "text", "stations.json")  # 预热文件，None 不预热
+USE_REGION_CACHE = True                                            # 逆地理编码（get_area）按格子 + 行政区外包框本地判定
+REGION_CACHE_PRECISION = 6                                         # geohash 精度（6 约 1.2km × 0.6km）
+REGION_CACHE_MAX_CELLS = 20000                                     # 最多缓存格子数
+REGION_CACHE_MAX_OBS = 32                                          # 每个行政区保留的 regeo 观测点数
+REGION_CACHE_MAX_DISTRICTS = 512                                   # 最多保留的行政区数，超出按 LRU 淘汰
+REGION_FILL_MAX_KM = 20.0                                          # 沿路两采样点同区且相距不超过该值时，中间点直接沿用该区
+USE_GEOCODE_CACHE = True                                           # 地址 → 坐标缓存：内存 LRU + SQLite
+GEOCODE_CACHE_PATH = os.path.join(CACHE_DIR, "geocode.sqlite")     # SQLite 文件路径，None 只用内存
+GEOCODE_CACHE_TTL_S = 30 * 24 * 3600                               # 条目有效期（秒）
+GEOCODE_CACHE_MEMORY_ITEMS = 4096                                  # 内存 LRU 条目数
+GEOCODE_CACHE_MAX_ENTRIES = 100000                                 # SQLite 最大条目数，超出按最近访问时间淘汰
+USE_PLAN_CACHE = True                                              # 完整规划结果缓存（热门起终点直接返回）
+PLAN_CACHE_DIR = CACHE_DIR                                         # 文件名 plan_<md5>.json
+PLAN_CACHE_PERSIST = True                                          # 是否落盘；False 只用内存
+PLAN_CACHE_TTL_S = 6 * 3600                                        # 条目有效期（秒）
+PLAN_CACHE_MEMORY_ITEMS = 512                                      # 内存 LRU 条目数
+PLAN_CACHE_MAX_FILES = 2000                                        # 磁盘上最多保留的规划结果文件数
+PLAN_CACHE_GRID_DECIMALS = 3                                       # 起终点吸附网格（3 位小数约 100 m）
+PLAN_CACHE_SOC_BUCKET = 5                                          # 起始电量分桶（%），只用于缓存键，规划按真实电量
+
+# ===== 规划任务（异步任务模式） =====
+PLAN_JOB_WORKERS = 4         # 同时执行的规划任务数，其余排队
+PLAN_JOB_TTL_S = 1800        # 任务结束后保留结果的时长（秒）
+PLAN_JOB_MAX_KEEP = 200      # 最多保留的任务数（超出时先清理最早结束的）
 
 # ===== 其他 =====
 RANDOM_SEED = 42   # 随机种子
@@ -42,6 +93,22 @@ search_way = "行政"     # "圆形" 或 "行政"
 AK2 = "fYcVa9810AKiixV8SR9MCGhvgXbkoBpU" #用于wbj地图
 OPEN = False               # True 启用限频；False 不限频
 MAX_RETRIES = 30
+AK_BACKOFF_S = 5.0         # AK 遇到配额类错误后暂停调度的初始时长（秒），连续出错时翻倍
+AK_MAX_BACKOFF_S = 600.0   # 暂停时长上限（秒）
+DISPATCH_INFLIGHT_PER_QPS = 2   # 调度器并发数 = 所有 AK 该类 QPS 之和 × 此系数
+HTTP_CONN_LIMIT = 100          # 每个 AK 会话的连接池上限
+HTTP_CONN_LIMIT_PER_HOST = 20  # 同一主机的连接上限
+HTTP_KEEPALIVE_S = 60.0        # 空闲 keep-alive 连接保留时长（秒）
+HTTP_DNS_TTL_S = 600           # DNS 解析结果缓存时长（秒）
+HTTP_TIMEOUT_S = 15.0          # 单次请求总超时（秒）
+USE_SINGLE_FLIGHT = True       # 合并参数相同的在途请求（不同 AK 也合并），只真正发出一次
+ROUTE_MATRIX_MAX_ELEMENTS = 50  # 批量算路单次请求的 起点数 × 终点数 上限
+ROUTE_MATRIX_PACK_WINDOW = 32   # 拼批时向后查找可合并起点的窗口大小
+USE_STATION_PIPELINE = True     # 沿路搜站与批量算路流水线执行（边收站点边请求距离）
+PIPELINE_FLUSH_PAIRS = 200      # 流水线中积累到这么多新点对就发出一轮批量算路
+USE_CORRIDOR_PRUNING = True     # 按路线折线剪枝候选边（投影里程 + 横向偏移），关闭即可对比最优性损失；没取到路线折线时不剪枝
+CORRIDOR_HALF_WIDTH_KM = 30.0   # 离路线折线超过该距离的站点不建边
+CORRIDOR_MIN_PROGRESS_RATIO = 0.5   # 候选边沿折线的前进量至少为直线距离的该比例（0 只按横向偏移剪枝）
 QPS_MATRIX = [
     {
     "ak": "UIAbWq8rLfKdrUx5I76YJLX6aRsXGUE3",
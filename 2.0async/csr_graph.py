@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+csr_graph.py
+
+压缩稀疏行（CSR）格式的图邻接结构，供 graph_builder 与 path_planner 共用。
+
+节点 u 的邻居存放在 targets[offsets[u]:offsets[u+1]]，对应边权在 weights 的同一区间。
+三个缓冲区都是 array.array（offsets/targets 为 int32，weights 为 float64），
+每条边只占 12 字节，而 Dict[int, List[Tuple[int, float]]] 每条边要一个 tuple + 一个 float 对象。
+
+CSRGraph 提供与 dict 邻接表相同的读取接口（get / [] / keys / items / len），
+因此现有按 adj.get(u, []) 遍历邻居的代码无需修改即可直接使用。
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+Adjacency = Dict[int, List[Tuple[int, float]]]
+
+
+class CSRGraph:
+    __slots__ = ("n", "offsets", "targets", "weights")
+
+    def __init__(self, n: int, offsets: array, targets: array, weights: array):
+        self.n = n
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+
+    # ------------------------
+    # 构造
+    # ------------------------
+    @classmethod
+    def from_adj(cls, adj: Adjacency, n: Optional[int] = None) -> "CSRGraph":
+        """由 dict 邻接表构造（保持每个节点内的邻居顺序）"""
+        if n is None:
+            n = max(adj.keys(), default=-1) + 1
+        offsets = array("i", [0]) * (n + 1)
+        targets = array("i")
+        weights = array("d")
+        for u in range(n):
+            for v, w in adj.get(u, ()):
+                targets.append(v)
+                weights.append(w)
+            offsets[u + 1] = len(targets)
+        return cls(n, offsets, targets, weights)
+
+    @classmethod
+    def from_edges(cls, n: int, edges: Iterable[Tuple[int, int, float]], symmetric: bool = True) -> "CSRGraph":
+        """由边列表 (u, v, w) 构造；symmetric=True 时每条边同时写入 u→v 与 v→u（计数排序，O(n + E)）"""
+        src = array("i")
+        dst = array("i")
+        wts = array("d")
+        for u, v, w in edges:
+            src.append(u)
+            dst.append(v)
+            wts.append(w)
+            if symmetric:
+                src.append(v)
+                dst.append(u)
+                wts.append(w)
+
+        offsets = array("i", [0]) * (n + 1)
+        for u in src:
+            offsets[u + 1] += 1
+        for u in range(n):
+            offsets[u + 1] += offsets[u]
+
+        m = len(src)
+        targets = array("i", [0]) * m
+        weights = array("d", [0.0]) * m
+        cursor = offsets[:-1]
+        for k in range(m):
+            u = src[k]
+            pos = cursor[u]
+            targets[pos] = dst[k]
+            weights[pos] = wts[k]
+            cursor[u] = pos + 1
+        return cls(n, offsets, targets, weights)
+
+    def to_adj(self) -> Adjacency:
+        """转回 dict 邻接表"""
+        return {u: self[u] for u in range(self.n)}
+
+    # ------------------------
+    # 查询
+    # ------------------------
+    def neighbors(self, u: int) -> Iterator[Tuple[int, float]]:
+        """遍历 u 的 (邻居, 边权)"""
+        s, e = self.offsets[u], self.offsets[u + 1]
+        return zip(self.targets[s:e], self.weights[s:e])
+
+    def degree(self, u: int) -> int:
+        return self.offsets[u + 1] - self.offsets[u]
+
+    @property
+    def num_edges(self) -> int:
+        """有向边条数（无向图为无向边数的 2 倍）"""
+        return len(self.targets)
+
+    def nbytes(self) -> int:
+        """三个缓冲区占用的字节数"""
+        return sum(buf.itemsize * len(buf) for buf in (self.offsets, self.targets, self.weights))
+
+    # ------------------------
+    # 与 dict 邻接表兼容的接口
+    # ------------------------
+    def get(self, u: int, default=None):
+        if 0 <= u < self.n:
+            return self.neighbors(u)
+        return default
+
+    def __getitem__(self, u: int) -> List[Tuple[int, float]]:
+        if not 0 <= u < self.n:
+            raise KeyError(u)
+        return list(self.neighbors(u))
+
+    def __contains__(self, u: object) -> bool:
+        return isinstance(u, int) and 0 <= u < self.n
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.n))
+
+    def keys(self) -> range:
+        return range(self.n)
+
+    def items(self) -> Iterator[Tuple[int, List[Tuple[int, float]]]]:
+        for u in range(self.n):
+            yield u, self[u]
+
+
+AdjLike = Union[Adjacency, CSRGraph]
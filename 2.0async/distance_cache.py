@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+distance_cache.py
+
+站点对驾车距离的持久化缓存（SQLite），供 get_distance_matrix_batched_async 在请求百度批量算路前查询。
+
+- 键：起点、终点坐标按 DIST_CACHE_DECIMALS 位小数取整后的字符串（方向敏感，A→B 与 B→A 分别缓存）
+- TTL：超过 ttl_s 的条目视为未命中，并在写入时顺带清理
+- 容量：条目数超过 max_entries 时按最近访问时间淘汰最旧的 10%
+- 统计：hits / misses / writes / evictions，见 stats()
+"""
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+from utils import Coord
+from config import USE_DIST_CACHE, DIST_CACHE_PATH, DIST_CACHE_TTL_S, DIST_CACHE_MAX_ENTRIES, DIST_CACHE_DECIMALS
+
+PairKey = Tuple[str, str]
+
+
+class PairDistanceCache:
+    def __init__(self, path: str, ttl_s: float = DIST_CACHE_TTL_S, max_entries: int = DIST_CACHE_MAX_ENTRIES,
+                 decimals: int = DIST_CACHE_DECIMALS):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.decimals = decimals
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pair_distance ("
+            " origin TEXT NOT NULL, dest TEXT NOT NULL, km REAL NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL,"
+            " PRIMARY KEY (origin, dest))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pair_accessed ON pair_distance(accessed)")
+        self.conn.commit()
+
+    def key(self, a: Coord, b: Coord) -> PairKey:
+        """坐标取整后作为键"""
+        fmt = f"{{:.{self.decimals}f}},{{:.{self.decimals}f}}"
+        return fmt.format(a[0], a[1]), fmt.format(b[0], b[1])
+
+    def get_many(self, pairs: Iterable[Tuple[Coord, Coord]]) -> Dict[PairKey, float]:
+        """批量查询，返回命中的 {键: 距离 km}；未命中或已过期的键不在结果中"""
+        keys = list(dict.fromkeys(self.key(a, b) for a, b in pairs))
+        if not keys:
+            return {}
+        now = time.time()
+        found: Dict[PairKey, float] = {}
+        with self.lock:
+            # SQLite 单条语句的参数个数有限，分块查询
+            for start in range(0, len(keys), 400):
+                chunk = keys[start:start + 400]
+                where = " OR ".join(["(origin=? AND dest=?)"] * len(chunk))
+                args = [x for k in chunk for x in k]
+                rows = self.conn.execute(
+                    f"SELECT origin, dest, km, created FROM pair_distance WHERE {where}", args).fetchall()
+                for origin, dest, km, created in rows:
+                    if now - created <= self.ttl_s:
+                        found[(origin, dest)] = km
+            if found:
+                self.conn.executemany("UPDATE pair_distance SET accessed=? WHERE origin=? AND dest=?",
+                                      [(now, o, d) for o, d in found])
+                self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, a: Coord, b: Coord) -> Optional[float]:
+        return self.get_many([(a, b)]).get(self.key(a, b))
+
+    def put_many(self, items: Iterable[Tuple[Coord, Coord, float]]):
+        """批量写入 (起点, 终点, 距离 km)，随后清理过期条目并按容量淘汰"""
+        now = time.time()
+        rows = [(*self.key(a, b), float(km), now, now) for a, b, km in items]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pair_distance(origin, dest, km, created, accessed) VALUES (?,?,?,?,?)", rows)
+            self.writes += len(rows)
+            self.conn.execute("DELETE FROM pair_distance WHERE created < ?", (now - self.ttl_s,))
+            count = self.conn.execute("SELECT COUNT(*) FROM pair_distance").fetchone()[0]
+            if count > self.max_entries:
+                drop = count - self.max_entries + self.max_entries // 10
+                self.conn.execute(
+                    "DELETE FROM pair_distance WHERE rowid IN "
+                    "(SELECT rowid FROM pair_distance ORDER BY accessed ASC LIMIT ?)", (drop,))
+                self.evictions += drop
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM pair_distance").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "writes": self.writes,
+                "evictions": self.evictions, "size": size}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_pair_cache: Optional[PairDistanceCache] = None
+_pair_cache_lock = Lock()
+
+
+def get_pair_cache() -> Optional[PairDistanceCache]:
+    """进程内共享的缓存实例；USE_DIST_CACHE 关闭时返回 None"""
+    global _pair_cache
+    if not USE_DIST_CACHE:
+        return None
+    with _pair_cache_lock:
+        if _pair_cache is None:
+            _pair_cache = PairDistanceCache(DIST_CACHE_PATH)
+    return _pair_cache
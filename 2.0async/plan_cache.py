@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+plan_cache.py
+
+完整规划结果（plan_trip_async 的返回：规划结果 + 途经点 + 拼接好的 polyline + 沿路充电站）缓存，
+热门起终点直接命中，不再走搜站 / 建图 / 规划 / 拼接导航。存储见 json_store.JsonFileLRU（plan_<md5>.json）。
+
+- 键：起终点坐标按 PLAN_CACHE_GRID_DECIMALS 位小数吸附到网格、车辆参数、起始电量分桶、规划引擎
+- 电量分桶：起始电量向下取整到 PLAN_CACHE_SOC_BUCKET 的倍数，只用于键；规划始终按真实电量，
+  缓存方案的起始电量不高于本次请求时才复用（见 plan_service.rebase_start_soc）
+- PLAN_CACHE_PERSIST 关闭时只用内存；磁盘文件数上限 PLAN_CACHE_MAX_FILES
+- 写入前去掉各段路线里百度的原始返回（raw），只保留渲染需要的字段
+"""
+from threading import Lock
+from typing import Any, Dict, Optional
+from utils import Coord
+from json_store import JsonFileLRU, md5_digest
+from config import (USE_PLAN_CACHE, PLAN_CACHE_DIR, PLAN_CACHE_PERSIST, PLAN_CACHE_TTL_S, PLAN_CACHE_MEMORY_ITEMS,
+                    PLAN_CACHE_MAX_FILES, PLAN_CACHE_GRID_DECIMALS, PLAN_CACHE_SOC_BUCKET, PLANNER_ENGINE)
+
+# 参与键计算的车辆参数
+_CAR_KEYS = ("name", "battery_kwh", "consumption_kwh_per_km", "avg_speed_kmph")
+
+
+def soc_bucket(start_soc: int, bucket: int = PLAN_CACHE_SOC_BUCKET) -> int:
+    """起始电量向下取整到 bucket 的倍数"""
+    return int(start_soc) // bucket * bucket
+
+
+def strip_raw(result: Dict[str, Any]) -> Dict[str, Any]:
+    """规划结果的浅拷贝，polyline 各段去掉 raw"""
+    out = dict(result)
+    out["polyline"] = [{k: v for k, v in seg.items() if k != "raw"} if isinstance(seg, dict) else seg
+                       for seg in result.get("polyline") or []]
+    return out
+
+
+class PlanCache:
+    def __init__(self, directory: Optional[str], ttl_s: float = PLAN_CACHE_TTL_S,
+                 memory_items: int = PLAN_CACHE_MEMORY_ITEMS, decimals: int = PLAN_CACHE_GRID_DECIMALS,
+                 max_files: int = PLAN_CACHE_MAX_FILES):
+        """directory 为 None 时只用内存"""
+        self.decimals = decimals
+        self.store = JsonFileLRU("plan", directory, ttl_s, memory_items, max_files)
+
+    def digest(self, start: Coord, end: Coord, car: Dict[str, Any], start_soc: int) -> str:
+        fmt = f"{{:.{self.decimals}f}},{{:.{self.decimals}f}}"
+        car_key = ",".join(str(car.get(k)) for k in _CAR_KEYS)
+        return md5_digest(f"{fmt.format(*start)}|{fmt.format(*end)}|{car_key}|{soc_bucket(start_soc)}|{PLANNER_ENGINE}")
+
+    def get(self, start: Coord, end: Coord, car: Dict[str, Any], start_soc: int) -> Optional[Dict[str, Any]]:
+        return self.store.get(self.digest(start, end, car, start_soc))
+
+    def put(self, start: Coord, end: Coord, car: Dict[str, Any], start_soc: int, result: Dict[str, Any]):
+        self.store.put(self.digest(start, end, car, start_soc), strip_raw(result))
+
+    def stats(self) -> Dict[str, int]:
+        return self.store.stats()
+
+
+_plan_cache: Optional[PlanCache] = None
+_plan_cache_lock = Lock()
+
+
+def get_plan_cache() -> Optional[PlanCache]:
+    """进程内共享的规划结果缓存；USE_PLAN_CACHE 关闭时返回 None"""
+    global _plan_cache
+    if not USE_PLAN_CACHE:
+        return None
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            _plan_cache = PlanCache(PLAN_CACHE_DIR if PLAN_CACHE_PERSIST else None)
+    return _plan_cache
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+plan_jobs.py
+
+规划任务模式：提交后立即返回任务 id，规划在后台事件循环中执行，HTTP 请求线程不再被整个流程占住。
+
+- PlanJobManager.submit(...)：创建任务并排队，最多 PLAN_JOB_WORKERS 个同时执行
+- 每个阶段（plan_service.PLAN_STAGES）完成后追加一条进度事件（阶段名 + 阶段结果），
+  客户端可轮询 snapshot(since) 或用 SSE 持续接收（web_app / asgi_app 的 /plan/jobs 路由）
+- 等待进度：线程里用 wait（Flask），事件循环里用 wait_async（ASGI，不占线程池）
+- 任务状态：queued → running → done / error；结束 PLAN_JOB_TTL_S 秒后清理
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from ak_manner import AK
+from async_runtime import get_runtime
+from plan_service import plan_trip_async, PLAN_STAGES
+from config import PLAN_JOB_WORKERS, PLAN_JOB_TTL_S, PLAN_JOB_MAX_KEEP
+
+
+class PlanJob:
+    def __init__(self, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []   # [{"seq", "stage", "data", "time"}]
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.cond = threading.Condition()
+        # 协程等待者：(所在事件循环, asyncio.Event)，_emit 经 call_soon_threadsafe 在各自循环中 set
+        self.async_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "error")
+
+    def _emit(self, stage: str, data: Dict[str, Any], status: Optional[str] = None):
+        with self.cond:
+            if status is not None:
+                self.status = status
+            self.stage = stage
+            self.events.append({"seq": len(self.events), "stage": stage, "data": data, "time": time.time()})
+            self.cond.notify_all()
+            waiters = list(self.async_waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass   # 等待者所在的循环已关闭
+
+    def events_since(self, since: int = 0) -> List[Dict[str, Any]]:
+        with self.cond:
+            return self.events[since:]
+
+    def wait(self, since: int, timeout: float) -> List[Dict[str, Any]]:
+        """阻塞到有序号 ≥ since 的事件或任务结束（最多 timeout 秒），返回这些事件"""
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.events) > since or self.done, timeout)
+            return self.events[since:]
+
+    async def wait_async(self, since: int, timeout: float) -> List[Dict[str, Any]]:
+        """wait 的协程版本：在当前事件循环上等待，不占用线程池（ASGI 的 SSE 连接用）"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        with self.cond:
+            if len(self.events) > since or self.done:
+                return self.events[since:]
+            self.async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.cond:
+                self.async_waiters.discard(waiter)
+        return self.events_since(since)
+
+    def snapshot(self, since: int = 0) -> Dict[str, Any]:
+        """轮询接口返回的状态（不含最终结果，结果见 result）"""
+        with self.cond:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": f"{sum(1 for e in self.events if e['stage'] in PLAN_STAGES)}/{len(PLAN_STAGES)}",
+                "error": self.error,
+                "events": self.events[since:],
+            }
+
+
+def sse_format(event: Dict[str, Any]) -> str:
+    """进度事件 → 一条 SSE 消息（id 为事件序号，断线重连时客户端以 Last-Event-ID 续传）"""
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"id: {event['seq']}\nevent: {event['stage']}\ndata: {data}\n\n"
+
+
+SSE_KEEPALIVE = ": keep-alive\n\n"
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+JOB_NOT_FOUND = {"error": "任务不存在或已过期"}
+
+
+def parse_since(value: Optional[str]) -> int:
+    """?since= 的值 → 下一个要发送的事件序号"""
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def resume_from(last_event_id: Optional[str], since: Optional[str]) -> int:
+    """SSE 起始序号：断线重连带 Last-Event-ID（最后收到的序号）时从其下一条续传，否则按 ?since="""
+    if last_event_id is not None:
+        return parse_since(last_event_id) + 1
+    return parse_since(since)
+
+
+def job_links(job: "PlanJob", url_for: Callable[..., str]) -> Dict[str, str]:
+    """提交任务的响应体；url_for 为 Flask / Quart 各自的 url_for"""
+    return {
+        "job_id": job.id,
+        "status_url": url_for("plan_job_status", job_id=job.id),
+        "events_url": url_for("plan_job_events", job_id=job.id),
+        "result_url": url_for("plan_job_result", job_id=job.id),
+    }
+
+
+def sse_stream(job: "PlanJob", since: int, keepalive_s: float = 15.0) -> Iterator[str]:
+    """SSE 消息流（线程中阻塞等待，Flask 用）：逐条推送进度事件，任务结束后结束"""
+    while True:
+        events = job.wait(since, keepalive_s)
+        if not events:
+            if job.done:
+                return
+            yield SSE_KEEPALIVE
+            continue
+        for event in events:
+            yield sse_format(event)
+        since += len(events)
+
+
+async def sse_stream_async(job: "PlanJob", since: int, keepalive_s: float = 15.0) -> AsyncIterator[bytes]:
+    """sse_stream 的协程版本（在事件循环上等待，ASGI 用）"""
+    while True:
+        events = await job.wait_async(since, keepalive_s)
+        if not events:
+            if job.done:
+                return
+            yield SSE_KEEPALIVE.encode("utf-8")
+            continue
+        for event in events:
+            yield sse_format(event).encode("utf-8")
+        since += len(events)
+
+
+class PlanJobManager:
+    def __init__(self, aks: List[AK], workers: int = PLAN_JOB_WORKERS, ttl_s: float = PLAN_JOB_TTL_S,
+                 max_keep: int = PLAN_JOB_MAX_KEEP, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        aks: 规划使用的 AK 列表
+        loop: 执行任务的事件循环；默认使用 async_runtime 的常驻循环（ASGI 下传入服务器循环）
+        """
+        self.aks = aks
+        self.workers = workers
+        self.ttl_s = ttl_s
+        self.max_keep = max_keep
+        self.loop = loop
+        self.jobs: "OrderedDict[str, PlanJob]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.semaphores: Dict[int, asyncio.Semaphore] = {}   # 每个事件循环一个，限制同时执行的任务数
+
+    def submit(self, origin: str, destination: str, brand: str = "", start_soc: int = 70) -> PlanJob:
+        job = PlanJob({"origin": origin, "destination": destination, "brand": brand, "start_soc": start_soc})
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+        loop = self.loop or get_runtime().start()
+        asyncio.run_coroutine_threadsafe(self._run(job), loop)
+        return job
+
+    def get(self, job_id: str) -> Optional[PlanJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    async def _run(self, job: PlanJob):
+        loop = asyncio.get_running_loop()
+        sem = self.semaphores.get(id(loop))
+        if sem is None:
+            sem = self.semaphores[id(loop)] = asyncio.Semaphore(self.workers)
+        async with sem:
+            job._emit("start", {}, status="running")
+            try:
+                p = job.params
+                job.result = await plan_trip_async(p["origin"], p["destination"], p["brand"], p["start_soc"],
+                                                   self.aks, progress=job._emit)
+                job.finished = time.time()
+                job._emit("done", {}, status="done")
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.finished = time.time()
+                job._emit("error", {"message": job.error}, status="error")
+
+    def _prune(self):
+        """清理超过 TTL 的已结束任务；总数超过 max_keep 时再按创建顺序清理已结束的任务"""
+        now = time.time()
+        for job_id in [k for k, j in self.jobs.items() if j.done and now - j.finished > self.ttl_s]:
+            del self.jobs[job_id]
+        for job_id in [k for k, j in self.jobs.items() if j.done][:max(0, len(self.jobs) - self.max_keep + 1)]:
+            del self.jobs[job_id]
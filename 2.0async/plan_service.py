@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+plan_service.py
+
+/plan 的完整流程（车辆参数 → 地理编码 → 沿路搜站 → 建图 / 稀疏化 → 路径规划 → 拼接导航），协程实现：
+- 百度请求在当前事件循环中直接 await，等待 I/O 时同一循环可以处理其他规划请求
+- 数据库查询、建图筛边、路径规划等阻塞 / CPU 计算放到线程池（asyncio.to_thread），不阻塞事件循环
+- Flask（web_app）经 async_runtime.run_sync 调用；ASGI（asgi_app）在服务器的事件循环中直接 await
+
+plan_trip_async 返回 {"polyline", "nodes", "stations", "plan", "start_soc", "path_nodes"}，
+result_page_context 取出 result.html 的模板参数；parse_plan_form 解析 Flask / Quart 共用的表单；
+传入 progress 回调时每个阶段完成后调用 progress(阶段名, 阶段结果)，阶段结果可直接 JSON 序列化（见 PLAN_STAGES）。
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+from config import AK2, USE_CORRIDOR_PRUNING, USE_STATION_PIPELINE, USE_BAIDU_POI, USE_BAIDU_DIS, CAR, USE_SPARSIFICATION, SPANNER_EPSILON, USE_CAR, USE_CSR_GRAPH
+from baidu_api_impl import geocode_many, route_polyline_points, iter_stations_along_route, search_stations_along_route, get_route_polyline_async
+from graph_builder import build_graph_streaming_async, build_graph_with_endpoints_async, build_spanner_graph_async, sparsify_by_knn
+import path_planner
+from csr_graph import CSRGraph
+from ak_manner import AK
+from save import print_ev_plan
+from plan_cache import get_plan_cache
+
+# 阶段名（按执行顺序），progress 回调与任务进度共用
+PLAN_STAGES = ("car", "geocode", "stations", "graph", "plan", "polyline")
+
+Progress = Callable[[str, Dict], None]
+
+
+def parse_plan_form(form) -> Tuple[str, str, str, int]:
+    """/plan 与 /plan/jobs 的表单 → (origin, destination, brand, start_soc)；start_soc 不是整数时抛 ValueError"""
+    brand = form.get("brand", "").strip()
+    start_soc = int(form.get("start_soc", "70"))
+    origin = form.get("origin", "").strip() or "天津城建大学"
+    destination = form.get("destination", "").strip() or "天津滨海国际机场"
+    return origin, destination, brand, start_soc
+
+
+def result_page_context(result: Dict) -> Dict:
+    """plan_trip_async 的结果 → result.html 的模板参数"""
+    return {
+        "polyline": result["polyline"],
+        "nodes": result["nodes"],
+        "stations": result["stations"],
+        "ak": AK2 if isinstance(AK2, str) else str(AK2),
+    }
+
+
+def load_car(brand: str) -> Dict:
+    """按品牌 / 名称从数据库取车辆参数，取不到时用默认车型；USE_CAR 关闭时直接用 config.CAR"""
+    if not USE_CAR:
+        return CAR
+    from db import session as db_session, crud as db_crud
+    with db_session.SessionLocal() as db:
+        car_obj = None
+        if brand:
+            car_obj = db_crud.get_car_by_brand(db, brand) or db_crud.get_car_by_name(db, brand)
+        if not car_obj:
+            car_obj = db_crud.get_car_by_name(db, CAR.get("name")) or db_crud.get_default_car(db)
+    return {
+        "name": car_obj.name if car_obj else CAR["name"],
+        "battery_kwh": car_obj.battery_kwh if car_obj else CAR["battery_kwh"],
+        "consumption_kwh_per_km": car_obj.consumption_kwh_per_km if car_obj else CAR["consumption_kwh_per_km"],
+        "initial_soc_percent": car_obj.initial_soc_percent if car_obj else CAR["initial_soc_percent"],
+        "avg_speed_kmph": car_obj.avg_speed_kmph if car_obj else CAR["avg_speed_kmph"],
+    }
+
+
+def load_stations_from_file(origin: str, destination: str, start_coord, end_coord) -> List[Dict]:
+    """离线模式：从 text/stations_area.txt 读取充电站，并把起终点插到首尾"""
+    stations = []
+    with open("text\\stations_area.txt", "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) >= 4:
+                name, lat_s, lng_s, address = parts[:4]
+                lat, lng = float(lat_s), float(lng_s)
+                stations.append({"name": name, "lat": lat, "lng": lng, "address": address})
+    stations.insert(0, {"name": "起点", "lat": start_coord[0], "lng": start_coord[1], "address": origin})
+    stations.append({"name": "终点", "lat": end_coord[0], "lng": end_coord[1], "address": destination})
+    return stations
+
+
+def load_graph_from_file(origin: str, destination: str, start_coord, end_coord):
+    """离线模式：从 text/stations_circle.txt 与 text/graph_edges.txt 读取节点和边"""
+    nodes = []
+    with open("text\\stations_circle.txt", "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) >= 4:
+                name, lat_s, lng_s, address = parts[:4]
+                lat, lng = float(lat_s), float(lng_s)
+                nodes.append({"name": name, "lat": lat, "lng": lng, "address": address})
+    nodes.insert(0, {"name": "起点", "lat": start_coord[0], "lng": start_coord[1], "address": origin})
+    nodes.append({"name": "终点", "lat": end_coord[0], "lng": end_coord[1], "address": destination})
+    adj = {i: [] for i in range(len(nodes))}
+    with open("text\\graph_edges.txt", "r", encoding="utf-8") as f:
+        for line in f:
+            if "->" in line:
+                parts = line.split("->")
+                u_name = parts[0].strip()
+                v_name, dist_part = parts[1].strip().split(":")
+                dist_km = float(dist_part.strip().split()[0])
+                u_idx = next((i for i, n in enumerate(nodes) if n["name"] == u_name), None)
+                v_idx = next((i for i, n in enumerate(nodes) if n["name"] == v_name), None)
+                if u_idx is not None and v_idx is not None:
+                    adj[u_idx].append((v_idx, dist_km))
+                    adj[v_idx].append((u_idx, dist_km))
+    return nodes, adj, 0, len(nodes) - 1
+
+
+def route_points_from_plan(res: Optional[Dict], points, nodes) -> List[Dict]:
+    """把规划结果的 drive / charge 步骤展开为地图上的途经点（相邻重复点去重）"""
+    route_points = []
+    if not res:
+        return route_points
+    for step in res["path"]:
+        if step["type"] == "drive":
+            from_idx = step["from"]
+            to_idx = step["to"]
+            # 出发点
+            route_points.append({
+                "lat": float(points[from_idx][0]),
+                "lng": float(points[from_idx][1]),
+                "soc": float(step["soc_before_pct"]),
+                "name": nodes[from_idx].get("name", f"Node {from_idx}")
+            })
+            # 到达点
+            route_points.append({
+                "lat": float(points[to_idx][0]),
+                "lng": float(points[to_idx][1]),
+                "soc": float(step["soc_after_pct"]),
+                "name": nodes[to_idx].get("name", f"Node {to_idx}")
+            })
+        elif step["type"] == "charge":
+            u = step["at"]
+            soc_before = step["soc_before_pct"]
+            soc_after = step["soc_after_pct"]
+            route_points.append({
+                "lat": float(points[u][0]),
+                "lng": float(points[u][1]),
+                "soc": float(soc_after),
+                "name": f"{nodes[u].get('name', f'Node {u}')} 🔋充电({soc_before}→{soc_after}%)"
+            })
+
+    # 去重（避免连续相同节点重复出现）
+    deduped = []
+    for p in route_points:
+        if not deduped or (deduped[-1]["lat"], deduped[-1]["lng"]) != (p["lat"], p["lng"]):
+            deduped.append(p)
+    return deduped
+
+
+def path_nodes(res: Optional[Dict], points, nodes) -> Dict[str, Dict]:
+    """规划路径经过的节点（坐标 + 名称），缓存命中时按新的起始电量重建途经点用"""
+    used = set()
+    for step in (res or {}).get("path", []):
+        used.update((step["from"], step["to"]) if step["type"] == "drive" else (step["at"],))
+    return {str(i): {"lat": float(points[i][0]), "lng": float(points[i][1]),
+                     "name": nodes[i].get("name", f"Node {i}")} for i in used}
+
+
+def rebase_start_soc(result: Dict, start_soc: int) -> Dict:
+    """
+    把缓存的方案换成本次请求的起始电量（缓存方案的起始电量不高于本次，路线与充电站沿用）：
+    多出的电量沿路径向后累加，遇到充电站时先抵扣该站的充电量（抵扣完的充电步骤去掉），途经点按新电量重建。
+    只部分抵扣的充电步骤沿用缓存方案的充电时长（偏保守）。
+    """
+    res = result.get("plan")
+    carry = start_soc - result.get("start_soc", start_soc)
+    if not res or carry <= 0:
+        return result
+    path = []
+    for step in res["path"]:
+        if carry > 0 and step["type"] == "drive":
+            step["soc_before_pct"] += carry
+            step["soc_after_pct"] += carry
+        elif carry > 0:
+            old_pct = step["soc_after_pct"] - step["soc_before_pct"]
+            before = step["soc_before_pct"] + carry
+            carry = max(0, before - step["soc_after_pct"])
+            if carry > 0 or before == step["soc_after_pct"]:
+                continue   # 到站电量已不低于原充电目标，不再充电
+            step["soc_before_pct"] = before
+            step["charged_pct"] = step["soc_after_pct"] - before
+            step["charged_kwh"] = step["charged_kwh"] * step["charged_pct"] / old_pct if old_pct else 0.0
+        path.append(step)
+    charging = [s for s in path if s["type"] == "charge"]
+    charge_min = sum(s.get("time_min", 0.0) for s in charging)
+    res["total_time_min"] -= res.get("total_charging_time_min", 0.0) - charge_min
+    res["total_charging_time_min"] = charge_min
+    res["total_energy_kwh_charged"] = sum(s.get("charged_kwh", 0.0) for s in charging)
+    res["path"] = path
+    nodes = {int(k): v for k, v in result.get("path_nodes", {}).items()}
+    points = {k: (v["lat"], v["lng"]) for k, v in nodes.items()}
+    result["nodes"] = route_points_from_plan(res, points, nodes)
+    result["start_soc"] = start_soc
+    return result
+
+
+def _plan_on_graph(nodes, adj, car_used, idx_origin, idx_destination, start_soc):
+    """稀疏化（可选）+ 路径规划，纯 CPU 计算"""
+    if USE_SPARSIFICATION == -1:
+        preserve = {idx_origin, idx_destination}
+        adj = sparsify_by_knn(nodes, adj, original_adj=adj, k=8, preserve=preserve, verbose=False)
+    points = [(n["lat"], n["lng"]) for n in nodes]
+    if USE_CSR_GRAPH and not isinstance(adj, CSRGraph):
+        adj = CSRGraph.from_adj(adj, len(nodes))
+    res = path_planner.plan_ev(points, adj, car_used, idx_origin, idx_destination, start_soc=start_soc)
+    print_ev_plan(res)
+    return res, points
+
+
+def _corridor(poly):
+    """建图剪枝用的走廊折线：USE_CORRIDOR_PRUNING 关闭或没取到路线时为 None（不剪枝，起终点直线不代表实际道路）"""
+    if not USE_CORRIDOR_PRUNING or not poly or len(poly) < 2:
+        return None
+    return poly
+
+
+def _edge_count(adj) -> int:
+    if isinstance(adj, CSRGraph):
+        return adj.num_edges // 2
+    return sum(len(v) for v in adj.values()) // 2
+
+
+async def _stations_then_graph(origin: str, destination: str, start_coord, end_coord, max_range_km: float,
+                               aks: List[AK], report: Progress, poly=None):
+    """先搜完全部充电站再构图（稀疏化 / 离线模式，或关闭 USE_STATION_PIPELINE 时）"""
+    # --- 3. 充电站搜索 ---
+    logging.info("2.搜索充电站")
+    if USE_BAIDU_POI:
+        stations = await search_stations_along_route(start_coord, end_coord, aks, query_limit=10, poly=poly)
+    else:
+        stations = await asyncio.to_thread(load_stations_from_file, origin, destination, start_coord, end_coord)
+    report("stations", {"count": len(stations), "stations": stations})
+
+    # --- 4. 构图 ---
+    logging.info("3.构建图结构")
+    if USE_SPARSIFICATION == 1:
+        nodes, adj, idx_origin, idx_destination = await build_spanner_graph_async(
+            stations, origin=start_coord, destination=end_coord, max_range_km=max_range_km, aks=aks,
+            epsilon=SPANNER_EPSILON)
+    elif USE_BAIDU_DIS:
+        nodes, adj, idx_origin, idx_destination = await build_graph_with_endpoints_async(
+            stations, origin=start_coord, destination=end_coord, max_range_km=max_range_km, aks=aks, prefilter_factor=1,
+            corridor=_corridor(poly))
+    else:
+        nodes, adj, idx_origin, idx_destination = await asyncio.to_thread(
+            load_graph_from_file, origin, destination, start_coord, end_coord)
+
+    report("graph", {"nodes": len(nodes), "edges": _edge_count(adj)})
+    return nodes, adj, idx_origin, idx_destination, stations
+
+
+async def plan_trip_async(origin: str, destination: str, brand: str, start_soc: int, aks: List[AK],
+                          progress: Optional[Progress] = None) -> Dict:
+    """完整规划一次行程；任一步失败直接抛出异常，由调用方渲染错误页"""
+    report = progress or (lambda stage, data: None)
+
+    # --- 1. 车辆信息 ---
+    car_used = await asyncio.to_thread(load_car, brand)
+    logging.info("使用车辆: %s", car_used)
+    report("car", {"car": car_used})
+
+    # --- 2. 地理编码（起终点并发，重复地址命中 geocode_cache） ---
+    logging.info("1.获取起点和终点坐标")
+    start_coord, end_coord = await geocode_many([origin, destination], aks)
+    logging.info("起点坐标: %s 终点坐标: %s", start_coord, end_coord)
+    if start_coord is None or end_coord is None:
+        raise ValueError(f"地址解析失败: {origin if start_coord is None else destination}")
+    report("geocode", {"origin": start_coord, "destination": end_coord})
+
+    # 规划结果缓存（键按电量分桶）：缓存方案的起始电量不高于本次时一定可行，换成本次电量后直接返回；
+    # 否则按本次真实电量规划并覆盖缓存，同一桶内缓存的起始电量只会越来越低
+    cache = get_plan_cache()
+    if cache is not None:
+        cached = cache.get(start_coord, end_coord, car_used, start_soc)
+        if cached is not None and cached.get("start_soc", 101) <= start_soc:
+            logging.info("规划结果缓存命中: %s", cache.stats())
+            for stage in PLAN_STAGES[PLAN_STAGES.index("stations"):]:
+                report(stage, {"cached": True})
+            return rebase_start_soc(cached, start_soc)
+
+    max_range_km = car_used["battery_kwh"] / car_used["consumption_kwh_per_km"]
+    # 直达路线折线：沿路搜站与走廊剪枝共用，只请求一次
+    poly = await route_polyline_points(start_coord, end_coord, aks) if USE_BAIDU_POI else None
+    if USE_STATION_PIPELINE and USE_BAIDU_POI and USE_BAIDU_DIS and USE_SPARSIFICATION != 1:
+        # --- 3 + 4. 沿路搜站与批量算路流水线执行 ---
+        logging.info("2.搜索充电站 + 3.构建图结构（流水线）")
+        nodes, adj, idx_origin, idx_destination, stations = await build_graph_streaming_async(
+            iter_stations_along_route(start_coord, end_coord, aks, query_limit=10, poly=poly),
+            start_coord, end_coord, max_range_km=max_range_km, aks=aks, prefilter_factor=1,
+            corridor=_corridor(poly))
+        report("stations", {"count": len(stations), "stations": stations})
+        report("graph", {"nodes": len(nodes), "edges": _edge_count(adj)})
+    else:
+        nodes, adj, idx_origin, idx_destination, stations = await _stations_then_graph(
+            origin, destination, start_coord, end_coord, max_range_km, aks, report, poly)
+
+    # --- 5. 路径规划 ---
+    res, points = await asyncio.to_thread(
+        _plan_on_graph, nodes, adj, car_used, idx_origin, idx_destination, start_soc)
+    route_points = route_points_from_plan(res, points, nodes)
+    report("plan", {"found": res is not None, "route_points": route_points,
+                    "summary": {k: v for k, v in res.items() if k != "path"} if res else None})
+
+    # --- 6. 拼接导航 polyline ---
+    full_polyline = await get_route_polyline_async(route_points, aks)
+    report("polyline", {"segments": len(full_polyline)})
+
+    result = {"polyline": full_polyline, "nodes": route_points, "stations": stations, "plan": res,
+              "start_soc": start_soc, "path_nodes": path_nodes(res, points, nodes)}
+    if cache is not None and res is not None:
+        cache.put(start_coord, end_coord, car_used, start_soc, result)
+    return result
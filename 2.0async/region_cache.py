@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+region_cache.py
+
+逆地理编码（get_area：坐标 → 行政区）结果缓存。
+
+- 格子缓存：坐标所在 geohash 格子（精度 REGION_CACHE_PRECISION）→ 行政区名
+- 行政区观测点：每次真实 regeo 的结果按 (城市, 行政区) 记录观测点（同名区不会混在一起），
+  点落在同一行政区两个相距不超过 REGION_FILL_MAX_KM 的观测点之间（两点撑开的矩形内），
+  且没有其他行政区能这样覆盖它时，直接本地判定为该行政区；否则返回 None 交给 regeo
+- 有界：每个行政区最多保留 REGION_CACHE_MAX_OBS 个观测点，最多保留 REGION_CACHE_MAX_DISTRICTS 个行政区（LRU）
+- 统计：cell_hits / bbox_hits / misses，见 stats()
+"""
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+from utils import Coord, geohash_encode, haversine_km
+from config import (USE_REGION_CACHE, REGION_CACHE_PRECISION, REGION_CACHE_MAX_CELLS, REGION_CACHE_MAX_OBS,
+                    REGION_CACHE_MAX_DISTRICTS, REGION_FILL_MAX_KM)
+
+District = Tuple[str, str]   # (城市, 行政区)
+
+
+class _Observations:
+    """一个行政区的观测点（最近 max_obs 个）及其外包框，外包框只用于快速排除"""
+
+    def __init__(self, max_obs: int):
+        self.points: Deque[Coord] = deque(maxlen=max_obs)
+        self.box: Optional[List[float]] = None   # [min_lat, min_lng, max_lat, max_lng]
+
+    def add(self, lat: float, lng: float):
+        self.points.append((lat, lng))
+        lats = [p[0] for p in self.points]
+        lngs = [p[1] for p in self.points]
+        self.box = [min(lats), min(lngs), max(lats), max(lngs)]
+
+    def covers(self, lat: float, lng: float, max_span_km: float) -> bool:
+        """(lat, lng) 是否落在某两个相距不超过 max_span_km 的观测点撑开的矩形内"""
+        a, b, c, d = self.box
+        if not (a <= lat <= c and b <= lng <= d):
+            return False
+        pts = list(self.points)
+        for i in range(len(pts)):
+            for j in range(i + 1, len(pts)):
+                p, q = pts[i], pts[j]
+                if min(p[0], q[0]) <= lat <= max(p[0], q[0]) and min(p[1], q[1]) <= lng <= max(p[1], q[1]) \
+                        and haversine_km(p, q) <= max_span_km:
+                    return True
+        return False
+
+
+class RegionCache:
+    def __init__(self, precision: int = REGION_CACHE_PRECISION, max_cells: int = REGION_CACHE_MAX_CELLS,
+                 max_obs: int = REGION_CACHE_MAX_OBS, max_districts: int = REGION_CACHE_MAX_DISTRICTS,
+                 max_span_km: float = REGION_FILL_MAX_KM):
+        self.precision = precision
+        self.max_cells = max_cells
+        self.max_obs = max_obs
+        self.max_districts = max_districts
+        self.max_span_km = max_span_km
+        self.cells: "OrderedDict[str, str]" = OrderedDict()
+        self.districts: "OrderedDict[District, _Observations]" = OrderedDict()
+        self.lock = Lock()
+        self.cell_hits = 0
+        self.bbox_hits = 0
+        self.misses = 0
+
+    def lookup(self, lat: float, lng: float) -> Optional[str]:
+        """本地判定 (lat, lng) 所在行政区；无法判定返回 None"""
+        cell = geohash_encode(lat, lng, self.precision)
+        with self.lock:
+            area = self.cells.get(cell)
+            if area is not None:
+                self.cells.move_to_end(cell)
+                self.cell_hits += 1
+                return area
+            inside = [key for key, obs in self.districts.items() if obs.covers(lat, lng, self.max_span_km)]
+            if len(inside) == 1:
+                self.bbox_hits += 1
+                self.districts.move_to_end(inside[0])
+                area = inside[0][1]
+                self._remember_cell(cell, area)
+                return area
+            self.misses += 1
+            return None
+
+    def record(self, lat: float, lng: float, area: str, city: Optional[str] = None):
+        """记录一次真实 regeo 结果（area 为行政区名，city 为所属城市）"""
+        if not area:
+            return
+        key = (city or "", area)
+        with self.lock:
+            self._remember_cell(geohash_encode(lat, lng, self.precision), area)
+            obs = self.districts.get(key)
+            if obs is None:
+                obs = self.districts[key] = _Observations(self.max_obs)
+            obs.add(lat, lng)
+            self.districts.move_to_end(key)
+            while len(self.districts) > self.max_districts:
+                self.districts.popitem(last=False)
+
+    def _remember_cell(self, cell: str, area: str):
+        self.cells[cell] = area
+        self.cells.move_to_end(cell)
+        while len(self.cells) > self.max_cells:
+            self.cells.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"cell_hits": self.cell_hits, "bbox_hits": self.bbox_hits, "misses": self.misses,
+                    "cells": len(self.cells), "districts": len(self.districts)}
+
+
+_region_cache: Optional[RegionCache] = None
+_region_cache_lock = Lock()
+
+
+def get_region_cache() -> Optional[RegionCache]:
+    """进程内共享的缓存实例；USE_REGION_CACHE 关闭时返回 None"""
+    global _region_cache
+    if not USE_REGION_CACHE:
+        return None
+    with _region_cache_lock:
+        if _region_cache is None:
+            _region_cache = RegionCache()
+    return _region_cache
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+route_cache.py
+
+驾车路线（get_route_polyline 的返回结果）缓存，存储见 json_store.JsonFileLRU（内存 LRU + route_<md5>.json）。
+
+- 键：(起点, 终点, tactics)，坐标按 ROUTE_CACHE_DECIMALS 位小数取整
+- 磁盘文件数上限 ROUTE_CACHE_MAX_FILES，过期与超量文件定期清理
+- 写入前去掉百度的原始返回（raw），只保留折线与分段字段；命中的结果不含 raw
+"""
+from threading import Lock
+from typing import Any, Dict, Optional
+from utils import Coord
+from json_store import JsonFileLRU, md5_digest
+from config import (USE_ROUTE_CACHE, ROUTE_CACHE_DIR, ROUTE_CACHE_TTL_S, ROUTE_CACHE_MEMORY_ITEMS, ROUTE_CACHE_DECIMALS,
+                    ROUTE_CACHE_MAX_FILES)
+
+
+class RouteCache:
+    def __init__(self, directory: str, ttl_s: float = ROUTE_CACHE_TTL_S,
+                 memory_items: int = ROUTE_CACHE_MEMORY_ITEMS, decimals: int = ROUTE_CACHE_DECIMALS,
+                 max_files: int = ROUTE_CACHE_MAX_FILES):
+        self.decimals = decimals
+        self.store = JsonFileLRU("route", directory, ttl_s, memory_items, max_files)
+
+    def digest(self, start: Coord, end: Coord, tactics: Optional[int] = None) -> str:
+        fmt = f"{{:.{self.decimals}f}},{{:.{self.decimals}f}}"
+        return md5_digest(f"{fmt.format(*start)}|{fmt.format(*end)}|{tactics}")
+
+    def get(self, start: Coord, end: Coord, tactics: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return self.store.get(self.digest(start, end, tactics))
+
+    def put(self, start: Coord, end: Coord, route: Dict[str, Any], tactics: Optional[int] = None):
+        self.store.put(self.digest(start, end, tactics), {k: v for k, v in route.items() if k != "raw"})
+
+    def stats(self) -> Dict[str, int]:
+        return self.store.stats()
+
+
+_route_cache: Optional[RouteCache] = None
+_route_cache_lock = Lock()
+
+
+def get_route_cache() -> Optional[RouteCache]:
+    """进程内共享的路线缓存；USE_ROUTE_CACHE 关闭时返回 None"""
+    global _route_cache
+    if not USE_ROUTE_CACHE:
+        return None
+    with _route_cache_lock:
+        if _route_cache is None:
+            _route_cache = RouteCache(ROUTE_CACHE_DIR)
+    return _route_cache
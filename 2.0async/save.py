@@ -67,4 +67,8 @@ def print_ev_plan(res: Optional[Dict[str, object]]):
                   f"{'+' + str(round(step['charged_kwh'],2)):>10} "
                   f"{'-':>10}")
     print("=" * 80)
+    stats = res.get("stats")
+    if stats:
+        print(f"引擎: {stats.get('engine', 'discrete')}  搜索: {stats['search']} (eps={stats['eps']})  "
+              f"扩展状态数: {stats['expanded_states']}  入队次数: {stats['pushed_states']}")
     print("✅ 路径规划流程打印完毕\n")
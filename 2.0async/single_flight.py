@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+single_flight.py
+
+相同请求的合并（single-flight）：同一时刻参数完全相同的百度请求只真正发出一次，
+其余调用等待这一次的结果（成功结果或异常都原样分发）。
+
+- 键：URL + 排序后的参数（去掉 ak，不同 AK 发出的相同请求也合并）
+- SingleFlight：协程版本，按事件循环隔离；实际请求放在独立任务里，
+  发起者被取消不会影响其他等待者
+- SyncSingleFlight：线程版本，供同步的 AK.fetch 使用
+- 统计：calls / shared（被合并、没有真正发出的调用数），见 stats()
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from urllib.parse import urlencode
+
+# 不参与键计算的参数
+_IGNORED_PARAMS = ("ak", "sn", "timestamp")
+
+
+def request_key(url: str, params: Dict) -> str:
+    """URL + 规范化参数（按参数名排序、值转字符串、去掉 ak）"""
+    items = sorted((str(k), str(v)) for k, v in params.items() if k not in _IGNORED_PARAMS)
+    return f"{url}?{urlencode(items)}"
+
+
+class SingleFlight:
+    def __init__(self):
+        self.inflight: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """同键请求在途时等待它的结果，否则执行 fn() 并把结果分发给期间到达的同键调用"""
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        self.calls += 1
+        task = self.inflight.get(slot)
+        if task is None:
+            task = loop.create_task(fn())
+            self.inflight[slot] = task
+            task.add_done_callback(lambda t: self._forget(slot, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, slot: Tuple[int, str], task: asyncio.Task):
+        if self.inflight.get(slot) is task:
+            del self.inflight[slot]
+        if not task.cancelled():
+            task.exception()   # 已被等待者取走；避免无人等待时的 “never retrieved” 警告
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared, "inflight": len(self.inflight)}
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SyncSingleFlight:
+    def __init__(self):
+        self.inflight: Dict[str, _Call] = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self.lock:
+            self.calls += 1
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.inflight[key] = call
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.inflight[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"calls": self.calls, "shared": self.shared, "inflight": len(self.inflight)}
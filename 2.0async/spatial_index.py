@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+spatial_index.py
+
+站点坐标的空间索引：把 (lat, lng) 转成单位球面上的三维向量后建 KD 树（scipy cKDTree），
+球面距离 d 与弦长 c 单调对应（c = 2R·sin(d / 2R)），因此半径查询与 k 近邻都可以在 KD 树上精确完成。
+
+主要接口：
+- SpatialIndex(coords)
+    .query_radius(point, radius_km) → List[int]
+    .query_knn(point, k) → (List[float], List[int])
+    .pairs_within_km(radius_km) → (to_lists, dists)，格式与 utils.pairs_within_km 相同
+    .knn_edges(k) → List[(u, v, dist_km)]，每个点与其 k 近邻的无向边（去重，u<v）
+- delaunay_edges(coords) → List[(u, v, dist_km)]，局部等距投影下的 Delaunay 三角剖分边
+- PolylineIndex(poly)
+    .distance_km(point) → float，与 utils.distance_point_to_polyline_km 结果一致，只检查附近的线段
+    .project(point) → (progress_km, offset_km)，与 utils.polyline_progress_km 结果一致
+"""
+import math
+from typing import List, Tuple
+import numpy as np
+from scipy.spatial import cKDTree, Delaunay, QhullError
+from utils import Coord, EARTH_R_KM, haversine_km, point_segment_distance_km, point_segment_projection
+
+
+def to_unit_vectors(coords) -> np.ndarray:
+    """(lat, lng) 角度 → 单位球面三维坐标，返回 (n, 3) 数组"""
+    pts = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+    lat, lng = pts[:, 0], pts[:, 1]
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def km_to_chord(d_km: float) -> float:
+    """球面距离（km）→ 单位球上的弦长"""
+    if d_km >= math.pi * EARTH_R_KM:
+        return 2.0 + 1e-12
+    return 2.0 * math.sin(d_km / (2.0 * EARTH_R_KM)) + 1e-12
+
+
+def chord_to_km(c):
+    """单位球上的弦长 → 球面距离（km），支持标量与数组"""
+    return 2.0 * EARTH_R_KM * np.arcsin(np.clip(np.asarray(c) / 2.0, 0.0, 1.0))
+
+
+class SpatialIndex:
+    """节点坐标上的 KD 树索引（构建 O(n log n)，单次半径 / kNN 查询约 O(log n + 结果数)）"""
+
+    def __init__(self, coords: List[Coord]):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.tree = cKDTree(to_unit_vectors(self.coords))
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def query_radius(self, point: Coord, radius_km: float) -> List[int]:
+        """返回与 point 球面距离不超过 radius_km 的节点下标（升序）"""
+        if len(self) == 0:
+            return []
+        idx = self.tree.query_ball_point(to_unit_vectors([point])[0], km_to_chord(radius_km))
+        return sorted(idx)
+
+    def query_knn(self, point: Coord, k: int) -> Tuple[List[float], List[int]]:
+        """返回距离 point 最近的 k 个节点：(距离 km 列表, 下标列表)，按距离升序"""
+        k = min(k, len(self))
+        if k <= 0:
+            return [], []
+        c, idx = self.tree.query(to_unit_vectors([point])[0], k=k)
+        c, idx = np.atleast_1d(c), np.atleast_1d(idx)
+        return chord_to_km(c).tolist(), idx.tolist()
+
+    def pairs_within_km(self, radius_km: float) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        所有 i<j 且球面距离不超过 radius_km 的点对，返回格式同 utils.pairs_within_km：
+          to_lists[i] 为 j 的升序数组，dists[i] 为对应的 haversine 距离（km）
+        只对 KD 树给出的候选对计算距离，代价 O(n log n + 候选对数)，而不是 O(n²)。
+        """
+        n = len(self)
+        if n == 0:
+            return [], []
+        pairs = self.tree.query_pairs(km_to_chord(radius_km), output_type="ndarray")
+        if len(pairs):
+            pairs = np.sort(pairs, axis=1)
+            pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        else:
+            pairs = np.empty((0, 2), dtype=np.int64)
+        i, j = pairs[:, 0], pairs[:, 1]
+        d = _haversine_rows_km(self.coords[i], self.coords[j])
+        keep = d <= radius_km
+        i, j, d = i[keep], j[keep], d[keep]
+        split_at = np.cumsum(np.bincount(i, minlength=n))[:-1]
+        return np.split(j.astype(np.int64), split_at), np.split(d, split_at)
+
+
+    def knn_edges(self, k: int) -> List[Tuple[int, int, float]]:
+        """每个点与其 k 个最近邻组成的无向边 (u, v, dist_km)，u<v 且去重"""
+        n = len(self)
+        k = min(k, n - 1)
+        if k <= 0:
+            return []
+        _, idx = self.tree.query(to_unit_vectors(self.coords), k=k + 1)
+        u = np.repeat(np.arange(n), k)
+        v = idx[:, 1:].reshape(-1)
+        return _unique_edges(self.coords, u, v)
+
+
+def delaunay_edges(coords: List[Coord]) -> List[Tuple[int, int, float]]:
+    """
+    Delaunay 三角剖分的边 (u, v, dist_km)。在以平均纬度为基准的等距投影平面上剖分，
+    其边集包含欧氏最小生成树且本身是常数倍伸展的 spanner；点数不足或全部共线时返回空列表。
+    """
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 3:
+        return []
+    xy = np.column_stack((pts[:, 1] * math.cos(math.radians(pts[:, 0].mean())), pts[:, 0]))
+    try:
+        tri = Delaunay(xy)
+    except (QhullError, ValueError):
+        return []
+    s = tri.simplices
+    u = np.concatenate((s[:, 0], s[:, 1], s[:, 2]))
+    v = np.concatenate((s[:, 1], s[:, 2], s[:, 0]))
+    return _unique_edges(pts, u, v)
+
+
+def _unique_edges(coords: np.ndarray, u: np.ndarray, v: np.ndarray) -> List[Tuple[int, int, float]]:
+    """规范化为 u<v、去重并附上 haversine 距离"""
+    pairs = np.unique(np.column_stack((np.minimum(u, v), np.maximum(u, v))), axis=0)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    d = _haversine_rows_km(coords[pairs[:, 0]], coords[pairs[:, 1]])
+    return list(zip(pairs[:, 0].tolist(), pairs[:, 1].tolist(), d.tolist()))
+
+
+def _haversine_rows_km(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """逐行 haversine：a[k] 与 b[k] 的距离（km）"""
+    if len(a) == 0:
+        return np.empty(0, dtype=np.float64)
+    a, b = np.radians(a), np.radians(b)
+    h = np.sin((b[:, 0] - a[:, 0]) / 2) ** 2 + \
+        np.cos(a[:, 0]) * np.cos(b[:, 0]) * np.sin((b[:, 1] - a[:, 1]) / 2) ** 2
+    return 2 * EARTH_R_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+class PolylineIndex:
+    """
+    折线顶点上的空间索引，用于点到折线距离查询。
+    设最近顶点距离为 D、最长线段为 L，则最近线段必有一个端点落在 D + L/2 范围内，
+    因此只需检查该范围内顶点相邻的线段。
+    """
+
+    def __init__(self, poly: List[Coord]):
+        self.poly = list(poly)
+        self.index = SpatialIndex(self.poly)
+        if len(self.poly) > 1:
+            seg = _haversine_rows_km(self.index.coords[:-1], self.index.coords[1:])
+            self.max_seg_km = float(seg.max())
+            self.seg_km = seg
+            self.cum_km = np.concatenate(([0.0], np.cumsum(seg)))   # 各顶点的沿线里程
+        else:
+            self.max_seg_km = 0.0
+            self.seg_km = np.empty(0, dtype=np.float64)
+            self.cum_km = np.zeros(len(self.poly), dtype=np.float64)
+
+    def _near_segments(self, p: Coord) -> List[int]:
+        d_nn, _ = self.index.query_knn(p, 1)
+        near = self.index.query_radius(p, d_nn[0] + self.max_seg_km / 2.0 + 1e-6)
+        segs = set()
+        for k in near:
+            if k > 0:
+                segs.add(k - 1)
+            if k < len(self.poly) - 1:
+                segs.add(k)
+        return sorted(segs)
+
+    def distance_km(self, p: Coord) -> float:
+        """点 p 到折线的距离（km）"""
+        if len(self.poly) < 2:
+            return 0.0
+        return min(point_segment_distance_km(p, self.poly[s], self.poly[s + 1]) for s in self._near_segments(p))
+
+    def project(self, p: Coord) -> Tuple[float, float]:
+        """点 p 在折线上的投影：(沿线里程 km, 横向距离 km)"""
+        if len(self.poly) < 2:
+            return 0.0, (haversine_km(p, self.poly[0]) if self.poly else 0.0)
+        best, progress = float("inf"), 0.0
+        for s in self._near_segments(p):
+            t, d = point_segment_projection(p, self.poly[s], self.poly[s + 1])
+            if d < best:
+                best, progress = d, float(self.cum_km[s] + t * self.seg_km[s])
+        return progress, best
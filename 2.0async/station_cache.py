@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+station_cache.py
+
+按 geohash 格子缓存充电站搜索结果，供 search_stations_in_area 在请求 place_search 前查询。
+
+两张表分开记录，格子统一用 geohash（精度 STATION_CACHE_PRECISION）：
+- 覆盖（coverage）：查询点所在格子 → 该格子内某次 place_search 真正完成时返回的站点；
+  只有覆盖过的格子才算热格子，get 直接返回它的结果，不再请求
+- 归属（members）：站点自身坐标所在格子 → 落在该格子内的站点；put 与预热都只按站点坐标写入，
+  只表示“已知有这些站点”，不代表该格子搜索完整（is_covered 仍为 False）；
+  但格子内已知站点不少于查询要的 limit 个时，lookup 直接用它们回答，同样不再请求
+- 去重：站点按 uid 去重，同一 uid 只保存一份字典
+- TTL / 容量：覆盖超过 ttl_s 视为冷格子；覆盖格子数超过 max_tiles 时按 LRU 淘汰
+- 预热：warm_from_file 读取 search_stations_along_route 结果格式的 JSON（如 text/stations.json），只写入归属表，
+  站点足够密的格子由此免去 place_search
+"""
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Set
+from utils import geohash_encode, haversine_km
+from config import (USE_STATION_CACHE, STATION_CACHE_PRECISION, STATION_CACHE_TTL_S,
+                    STATION_CACHE_MAX_TILES, STATION_CACHE_WARM_FILE)
+
+
+def _station_coord(st: Dict):
+    loc = st.get("location") or {}
+    lat = st.get("lat", loc.get("lat"))
+    lng = st.get("lng", loc.get("lng"))
+    if lat is None or lng is None:
+        return None
+    return float(lat), float(lng)
+
+
+class StationTileCache:
+    def __init__(self, precision: int = STATION_CACHE_PRECISION, ttl_s: float = STATION_CACHE_TTL_S,
+                 max_tiles: int = STATION_CACHE_MAX_TILES):
+        self.precision = precision
+        self.ttl_s = ttl_s
+        self.max_tiles = max_tiles
+        self.coverage: "OrderedDict[str, tuple]" = OrderedDict()   # 查询格子 -> (写入时间, [uid, ...])
+        self.members: Dict[str, Set[str]] = {}                      # 站点所在格子 -> {uid}
+        self.stations: Dict[str, Dict] = {}                         # uid -> 站点字典
+        self.pinned: Set[str] = set()                               # 预热载入的站点，不随覆盖淘汰
+        self.lock = Lock()
+        self.hits = 0
+        self.member_hits = 0
+        self.misses = 0
+
+    def tile_of(self, lat: float, lng: float) -> str:
+        return geohash_encode(lat, lng, self.precision)
+
+    def _covered(self, tile: str) -> Optional[List[Dict]]:
+        """格子的未过期覆盖结果，过期的顺便删除（调用方持有锁）"""
+        item = self.coverage.get(tile)
+        if item is None or time.time() - item[0] > self.ttl_s:
+            self.coverage.pop(tile, None)
+            return None
+        self.coverage.move_to_end(tile)
+        return [self.stations[uid] for uid in item[1] if uid in self.stations]
+
+    def _members_of(self, tile: str) -> List[Dict]:
+        return [self.stations[uid] for uid in self.members.get(tile, ()) if uid in self.stations]
+
+    def get(self, lat: float, lng: float, limit: Optional[int] = None) -> Optional[List[Dict]]:
+        """已覆盖的格子返回其搜索结果（按到查询点的距离升序，最多 limit 个）；未覆盖返回 None"""
+        with self.lock:
+            result = self._covered(self.tile_of(lat, lng))
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self._nearest(lat, lng, result, limit)
+
+    def lookup(self, lat: float, lng: float, limit: int) -> Optional[List[Dict]]:
+        """
+        search_stations_in_area 的缓存查询：先查覆盖（同 get）；未覆盖时，格子内已知站点（含预热）
+        不少于 limit 个则返回其中最近的 limit 个；都不满足返回 None
+        """
+        tile = self.tile_of(lat, lng)
+        with self.lock:
+            result = self._covered(tile)
+            if result is not None:
+                self.hits += 1
+            else:
+                result = self._members_of(tile)
+                if len(result) < limit:
+                    self.misses += 1
+                    return None
+                self.member_hits += 1
+        return self._nearest(lat, lng, result, limit)
+
+    def can_answer(self, lat: float, lng: float, limit: int) -> bool:
+        """lookup 是否会命中（不计入统计）"""
+        return self.is_covered(lat, lng) or len(self.known_stations(lat, lng)) >= limit
+
+    @staticmethod
+    def _nearest(lat: float, lng: float, stations: List[Dict], limit: Optional[int]) -> List[Dict]:
+        stations = sorted(stations, key=lambda st: haversine_km((lat, lng), _station_coord(st) or (lat, lng)))
+        return stations[:limit] if limit is not None else stations
+
+    def is_covered(self, lat: float, lng: float) -> bool:
+        """(lat, lng) 所在格子是否有未过期的完整搜索结果（不计入命中统计）"""
+        with self.lock:
+            item = self.coverage.get(self.tile_of(lat, lng))
+            return item is not None and time.time() - item[0] <= self.ttl_s
+
+    def known_stations(self, lat: float, lng: float) -> List[Dict]:
+        """站点坐标落在 (lat, lng) 所在格子内的已知站点（可能不完整）"""
+        with self.lock:
+            return self._members_of(self.tile_of(lat, lng))
+
+    def put(self, lat: float, lng: float, stations: List[Dict]):
+        """记录查询点 (lat, lng) 一次完成的搜索：结果作为该格子的覆盖，站点按自身坐标写入归属表"""
+        tile = self.tile_of(lat, lng)
+        with self.lock:
+            old = self.coverage.get(tile)
+            uids = list(old[1]) if old is not None else []
+            seen = set(uids)
+            for uid in self._add_members(stations):
+                if uid not in seen:
+                    seen.add(uid)
+                    uids.append(uid)
+            self.coverage[tile] = (time.time(), uids)
+            self.coverage.move_to_end(tile)
+            evicted = False
+            while len(self.coverage) > self.max_tiles:
+                self.coverage.popitem(last=False)
+                evicted = True
+            if evicted:
+                self._gc_stations()
+
+    def _add_members(self, stations: List[Dict]) -> List[str]:
+        """站点写入 stations 与归属表，返回有 uid 的站点 uid（调用方持有锁）"""
+        uids = []
+        for st in stations:
+            uid = st.get("uid")
+            if not uid:
+                continue
+            old = self.stations.get(uid)
+            if old is not None:
+                self._drop_member(uid, old)
+            self.stations[uid] = st
+            coord = _station_coord(st)
+            if coord is not None:
+                self.members.setdefault(self.tile_of(*coord), set()).add(uid)
+            uids.append(uid)
+        return uids
+
+    def _drop_member(self, uid: str, st: Dict):
+        coord = _station_coord(st)
+        if coord is None:
+            return
+        tile = self.tile_of(*coord)
+        members = self.members.get(tile)
+        if members is not None:
+            members.discard(uid)
+            if not members:
+                del self.members[tile]
+
+    def _gc_stations(self):
+        """删除既没有被覆盖引用、也不是预热载入的站点"""
+        alive = {uid for _, uids in self.coverage.values() for uid in uids} | self.pinned
+        for uid in [u for u in self.stations if u not in alive]:
+            self._drop_member(uid, self.stations.pop(uid))
+
+    def warm(self, stations: List[Dict]) -> int:
+        """按站点自身坐标预热归属表（不产生覆盖），返回涉及的格子数"""
+        with self.lock:
+            uids = self._add_members(stations)
+            self.pinned.update(uids)
+            return len({self.tile_of(*c) for c in (_station_coord(self.stations[u]) for u in uids) if c})
+
+    def warm_from_file(self, path: str) -> int:
+        """从 JSON 站点列表文件预热；文件不存在或为空时返回 0"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return 0
+        if not text.strip():
+            return 0
+        try:
+            stations = json.loads(text)
+        except ValueError as e:
+            print(f"[station_cache] 预热文件解析失败: {path}: {e}")
+            return 0
+        return self.warm(stations if isinstance(stations, list) else [])
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "member_hits": self.member_hits, "misses": self.misses, "covered_tiles": len(self.coverage),
+                    "member_tiles": len(self.members), "stations": len(self.stations)}
+
+
+_station_cache: Optional[StationTileCache] = None
+_station_cache_lock = Lock()
+
+
+def get_station_cache() -> Optional[StationTileCache]:
+    """进程内共享的缓存实例（首次创建时从 STATION_CACHE_WARM_FILE 预热）；USE_STATION_CACHE 关闭时返回 None"""
+    global _station_cache
+    if not USE_STATION_CACHE:
+        return None
+    with _station_cache_lock:
+        if _station_cache is None:
+            _station_cache = StationTileCache()
+            if STATION_CACHE_WARM_FILE:
+                _station_cache.warm_from_file(STATION_CACHE_WARM_FILE)
+    return _station_cache
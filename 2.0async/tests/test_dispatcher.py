@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""AKDispatcher 分配 AK 后只在真正请求时扣令牌"""
+import asyncio
+import time
+from ak_manner import AK, AKDispatcher
+
+
+def test_cache_hits_take_no_tokens():
+    ak = AK("fake", {"geocoding": 3})
+
+    async def cache_hit(job, ak):
+        return job   # 不经过 acquire
+
+    started = time.monotonic()
+    results = asyncio.run(AKDispatcher([ak]).run("geocoding", list(range(20)), cache_hit))
+    assert results == list(range(20))
+    # 20 个任务远超 3 QPS，但都没请求，既不等待也不扣令牌
+    assert time.monotonic() - started < 0.5
+    assert ak.tokens["geocoding"] == 3.0
+    assert ak.pending["geocoding"] == 0
+    assert ak.wait_time("geocoding") == 0.0
+
+
+def test_requests_take_tokens_when_they_acquire():
+    ak = AK("fake", {"geocoding": 3})
+
+    async def request(job, ak):
+        await ak.acquire("geocoding")
+        return job
+
+    asyncio.run(AKDispatcher([ak]).run("geocoding", list(range(3)), request))
+    assert ak.pending["geocoding"] == 0
+    assert ak.tokens["geocoding"] < 1.0
+
+
+def test_pending_jobs_spread_across_aks():
+    first, second = AK("first", {"geocoding": 2}), AK("second", {"geocoding": 2})
+    picked = []
+
+    async def request(job, ak):
+        picked.append(ak.ak)
+        await asyncio.sleep(0)   # 先让所有任务完成挑选，再取令牌
+        await ak.acquire("geocoding")
+
+    asyncio.run(AKDispatcher([first, second]).run("geocoding", list(range(4)), request, concurrency=4))
+    assert sorted(picked) == ["first", "first", "second", "second"]
+
+
+def test_single_flight_quota_error_backs_off_only_the_requesting_ak(monkeypatch):
+    import ak_manner
+    from ak_manner import BaiduAPIError
+    monkeypatch.setattr(ak_manner, "USE_SINGLE_FLIGHT", True)
+    first, second = AK("first", {"geocoding": 3}), AK("second", {"geocoding": 3})
+    calls = []
+
+    async def fake_fetch(self, url, params, api_type):
+        await self.acquire(api_type)
+        calls.append(self.ak)
+        await asyncio.sleep(0.05)   # 保持在途，让另一个任务合并进来
+        if self is first:
+            raise BaiduAPIError(status=302, message="配额超限", response={}, ak=self)
+        return {"status": 0}
+
+    monkeypatch.setattr(AK, "_fetch_async", fake_fetch)
+
+    async def request(job, ak):
+        return await ak.fetch_async("https://example.invalid/geocoding", {"address": "同一地址"}, "geocoding")
+
+    # 两个相同请求：first 只剩 1 个令牌，第一个任务用它发出并收到 302；
+    # 第二个任务分到 second，但合并到 first 的在途请求上，收到的是 first 的错误
+    first.tokens["geocoding"] = 1.0
+    results = asyncio.run(AKDispatcher([first, second]).run("geocoding", [0, 1], request, concurrency=2))
+    assert calls[0] == "first"
+    assert first.failures.get("geocoding") == 1
+    assert "geocoding" not in second.failures
+    assert all(r == {"status": 0} for r in results)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""地理编码缓存的 SQLite 层：过期条目清理与容量上限"""
+import time
+from geocode_cache import GeocodeCache
+
+
+def test_sqlite_table_is_bounded(tmp_path):
+    cache = GeocodeCache(str(tmp_path / "geocode.sqlite"), max_entries=10)
+    for i in range(30):
+        cache.put(f"地址{i}", (39.0 + i * 1e-3, 117.0))
+    assert cache.stats()["size"] <= 10
+    assert cache.get("地址29") is not None
+
+
+def test_expired_rows_are_deleted(tmp_path):
+    cache = GeocodeCache(str(tmp_path / "geocode.sqlite"), ttl_s=0.05)
+    cache.put("天津站", (39.13, 117.21))
+    time.sleep(0.1)
+    cache.put("天津西站", (39.16, 117.16))
+    assert cache.stats()["size"] == 1     # 写入第二条时第一条已过期
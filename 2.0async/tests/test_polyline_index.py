@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""PolylineIndex.project 只检查附近线段，结果应与逐段计算的 utils.polyline_progress_km 一致"""
+import random
+import pytest
+from spatial_index import PolylineIndex
+from utils import polyline_progress_km
+
+
+def _random_polyline(rng: random.Random, n: int):
+    lat, lng = 39.08, 117.10
+    poly = [(lat, lng)]
+    for _ in range(n - 1):
+        lat += rng.uniform(-0.02, 0.05)
+        lng += rng.uniform(-0.02, 0.05)
+        poly.append((lat, lng))
+    return poly
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_project_matches_polyline_progress_km(seed):
+    rng = random.Random(seed)
+    poly = _random_polyline(rng, 60)
+    index = PolylineIndex(poly)
+    lats = [p[0] for p in poly]
+    lngs = [p[1] for p in poly]
+    for _ in range(200):
+        p = (rng.uniform(min(lats) - 0.1, max(lats) + 0.1), rng.uniform(min(lngs) - 0.1, max(lngs) + 0.1))
+        progress, offset = index.project(p)
+        expected_progress, expected_offset = polyline_progress_km(p, poly)
+        assert offset == pytest.approx(expected_offset, abs=1e-6)
+        assert progress == pytest.approx(expected_progress, abs=1e-6)
+
+
+def test_project_degenerate_polyline():
+    p = (39.1, 117.2)
+    assert PolylineIndex([(39.0, 117.0)]).project(p) == pytest.approx(polyline_progress_km(p, [(39.0, 117.0)]))
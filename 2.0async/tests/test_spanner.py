@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Greedy-Spanner 的伸展保证：k 近邻候选时对候选边成立，完全图候选时对任意点对成立"""
+import asyncio
+import random
+import graph_builder
+import path_planner
+from config import CAR
+from graph_builder import greedy_spanner, spanner_candidate_edges, dijkstra_len
+
+EPSILON = 0.2
+
+
+def _points(n, seed=0):
+    rng = random.Random(seed)
+    return [(rng.uniform(38.5, 39.5), rng.uniform(116.5, 117.8)) for _ in range(n)]
+
+
+def _adj(n, edges):
+    adj = {i: [] for i in range(n)}
+    for u, v, d in edges:
+        adj[u].append((v, d))
+        adj[v].append((u, d))
+    return adj
+
+
+def test_candidate_edges_are_stretch_bounded():
+    points = _points(300)
+    adj = _adj(len(points), greedy_spanner(points, EPSILON, k=6))
+    for u, v, d in spanner_candidate_edges(points, k=6):
+        assert dijkstra_len(len(points), adj, u, v) <= (1 + EPSILON) * d + 1e-9
+
+
+def test_complete_candidates_bound_every_pair():
+    points = _points(60, seed=1)
+    adj = _adj(len(points), greedy_spanner(points, EPSILON, k=None))
+    pairs = spanner_candidate_edges(points, k=None)
+    assert len(pairs) == len(points) * (len(points) - 1) // 2
+    for u, v, d in pairs:
+        assert dijkstra_len(len(points), adj, u, v) <= (1 + EPSILON) * d + 1e-9
+
+
+def test_spanner_graph_is_plannable(monkeypatch):
+    """USE_SPARSIFICATION == 1 的建图结果带起终点与导航距离，可直接交给 plan_ev"""
+    requested = []
+
+    async def fake_matrix(origins, destinations, to_lists, aks):
+        requested.append(sum(len(t) for t in to_lists))
+        return [[None] * len(destinations) for _ in origins]   # 没有导航距离时退回直线距离
+
+    monkeypatch.setattr(graph_builder, "get_distance_matrix_batched_async", fake_matrix)
+    stations = [{"name": f"站{i}", "uid": f"u{i}", "lat": lat, "lng": lng}
+                for i, (lat, lng) in enumerate(_points(200, seed=2))]
+    origin, destination = (38.5, 116.5), (39.5, 117.8)
+    nodes, adj, idx_origin, idx_destination = asyncio.run(graph_builder.build_spanner_graph_async(
+        stations, origin=origin, destination=destination, max_range_km=CAR["max_range_km"], aks=[], as_csr=False))
+
+    assert (idx_origin, idx_destination) == (0, len(stations) + 1)
+    assert requested and requested[0] == sum(len(v) for v in adj.values()) // 2
+    points = [(n["lat"], n["lng"]) for n in nodes]
+    res = path_planner.plan_ev(points, adj, CAR, idx_origin, idx_destination, start_soc=30)
+    assert res is not None
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""充电站格子缓存：预热的站点不算覆盖，但足够多时 search_stations_in_area 不再请求 place_search"""
+import asyncio
+import pytest
+import baidu_api
+from ak_manner import AK
+from station_cache import StationTileCache
+
+
+def _stations(lat, lng, n):
+    return [{"name": f"站{i}", "uid": f"u{i}", "location": {"lat": lat + i * 1e-4, "lng": lng + i * 1e-4}}
+            for i in range(n)]
+
+
+class NoNetworkAK(AK):
+    async def fetch_async(self, url, params, api_type):
+        raise AssertionError(f"不应请求 {api_type}")
+
+
+def test_warmed_tile_is_not_coverage():
+    cache = StationTileCache()
+    cache.warm(_stations(39.10, 117.20, 5))
+    assert not cache.is_covered(39.10, 117.20)
+    assert cache.get(39.10, 117.20) is None
+    assert cache.can_answer(39.10, 117.20, 5)
+    assert not cache.can_answer(39.10, 117.20, 6)
+
+
+def test_warmed_tile_skips_place_search(monkeypatch):
+    cache = StationTileCache()
+    cache.warm(_stations(39.10, 117.20, 8))
+    monkeypatch.setattr(baidu_api, "get_station_cache", lambda: cache)
+
+    result = asyncio.run(baidu_api.search_stations_in_area(39.10, 117.20, NoNetworkAK("fake", {}), limit=5))
+    assert [st["uid"] for st in result] == ["u0", "u1", "u2", "u3", "u4"]
+    assert cache.stats()["member_hits"] == 1
+
+
+def test_sparse_warmed_tile_still_searches(monkeypatch):
+    cache = StationTileCache()
+    cache.warm(_stations(39.10, 117.20, 2))
+    monkeypatch.setattr(baidu_api, "get_station_cache", lambda: cache)
+
+    with pytest.raises(AssertionError, match="place_search"):
+        asyncio.run(baidu_api.search_stations_in_area(39.10, 117.20, NoNetworkAK("fake", {}), region="天津市", limit=5))
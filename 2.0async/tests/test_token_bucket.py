@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""令牌桶限流：虚拟时钟下每种 api_type 的实际速率不超过各自配置的 QPS"""
+import asyncio
+import heapq
+from typing import Dict
+import pytest
+import ak_manner
+from ak_manner import AK
+from config import QPS_MATRIX
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.now += max(0.0, seconds)
+
+
+def simulate_token_bucket(qps_limit: Dict[str, int], duration_s: float = 100.0,
+                          warmup_s: float = 10.0, workers: int = 8) -> Dict[str, float]:
+    """
+    令牌桶的确定性模拟（虚拟时钟，不真正 sleep）：每种 api_type 有 workers 个持续发请求的客户端，
+    不同类型的请求交错到达；每个请求取得令牌的时刻即发出下一个请求。
+    返回稳态区间 [warmup_s, warmup_s + duration_s) 内每种类型的实际通过速率（次/秒），应等于配置的 QPS。
+    """
+    ak = AK("simulation", qps_limit)
+    ak.tokens = {k: float(v) for k, v in qps_limit.items()}
+    ak.last_refill = {k: 0.0 for k in qps_limit}
+    events = []
+    seq = 0
+    for _ in range(workers):
+        for api_type in qps_limit:
+            events.append((0.0, seq, api_type))
+            seq += 1
+    heapq.heapify(events)
+    granted = {k: 0 for k in qps_limit}
+    end = warmup_s + duration_s
+    while events:
+        t, _, api_type = heapq.heappop(events)
+        if t >= end:
+            break
+        grant = t + ak._reserve(api_type, now=t)
+        if warmup_s <= grant < end:
+            granted[api_type] += 1
+        heapq.heappush(events, (grant, seq, api_type))
+        seq += 1
+    return {k: granted[k] / duration_s for k in qps_limit}
+
+
+@pytest.mark.parametrize("limits", [
+    QPS_MATRIX[0]["limits"],
+    {"place_search": 1, "distance_matrix": 5, "regeo": 50},
+])
+def test_simulated_rate_within_limit(limits):
+    rates = simulate_token_bucket(limits, duration_s=60.0, warmup_s=5.0, workers=4)
+    for api_type, limit in limits.items():
+        assert rates[api_type] <= limit + 1e-9
+        # 持续满载时应基本跑满配额，不因其他类型的请求而降速
+        assert rates[api_type] >= 0.95 * limit
+
+
+def test_acquire_respects_limit_with_fake_clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ak_manner.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(ak_manner.asyncio, "sleep", clock.sleep)
+    limits = {"place_search": 3, "distance_matrix": 1}
+    ak = AK("fake", limits)
+    granted = {k: [] for k in limits}
+
+    async def drive():
+        # 两种类型交替取令牌，每次取到后记录虚拟时间
+        for _ in range(200):
+            for api_type in limits:
+                await ak.acquire(api_type)
+                granted[api_type].append(clock.now)
+
+    asyncio.run(drive())
+    for api_type, limit in limits.items():
+        times = granted[api_type]
+        # 初始满桶可突发 limit 个，之后任意时刻累计通过数不超过 limit + limit × t
+        for n, t in enumerate(times, start=1):
+            assert n <= limit + limit * t + 1e-9
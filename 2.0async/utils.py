@@ -1,6 +1,7 @@
 import math
 import random
 from typing import List, Tuple
+import numpy as np
 from config import RANDOM_SEED
 import time
 from typing import List, Tuple
@@ -57,26 +58,106 @@ def haversine_km(a: Coord, b: Coord) -> float:
     return 2 * EARTH_R_KM * math.asin(math.sqrt(h))
 
 
+def haversine_matrix_km(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    向量化 haversine：a 为 (m, 2)、b 为 (k, 2) 的 (lat, lng) 角度数组，返回 (m, k) 距离矩阵（km）
+    """
+    a = np.radians(np.asarray(a, dtype=np.float64))
+    b = np.radians(np.asarray(b, dtype=np.float64))
+    lat1, lon1 = a[:, 0:1], a[:, 1:2]
+    lat2, lon2 = b[:, 0], b[:, 1]
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_R_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def pairs_within_km(coords: List[Coord], max_km: float = float("inf"),
+                    block_size: int = 1024) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """
+    所有 i<j 点对的直线距离预筛：返回 (to_lists, dists)
+      to_lists[i]: 满足 j>i 且 haversine(i, j) <= max_km 的 j（升序，int64 数组）
+      dists[i]:    对应的直线距离（km，float64 数组）
+    按 block_size 行分块计算，峰值内存约 block_size * n 个 float64。
+    """
+    pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    n = len(pts)
+    to_lists: List[np.ndarray] = []
+    dists: List[np.ndarray] = []
+    for start in range(0, n, block_size):
+        stop = min(n, start + block_size)
+        # 只算上三角：列从 start 开始
+        d = haversine_matrix_km(pts[start:stop], pts[start:])
+        rows = np.arange(start, stop)[:, None]
+        cols = np.arange(start, n)[None, :]
+        mask = (cols > rows) & (d <= max_km)
+        r, c = np.nonzero(mask)
+        counts = np.bincount(r, minlength=stop - start)
+        split_at = np.cumsum(counts)[:-1]
+        to_lists.extend(np.split(c + start, split_at))
+        dists.extend(np.split(d[r, c], split_at))
+    return to_lists, dists
+
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lng: float, precision: int = 5) -> str:
+    """
+    标准 geohash 编码。precision=5 的格子约 4.9km × 4.9km，6 约 1.2km × 0.6km
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits, ch, even = 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
 def polyline_sample(points: List[Coord], step: int) -> List[Coord]:
     if step <= 1:
         return points[:]
     return [p for i, p in enumerate(points) if i % step == 0] + ([points[-1]] if points else [])
 
 
-def point_segment_distance_km(p: Coord, a: Coord, b: Coord) -> float:
+def point_segment_projection(p: Coord, a: Coord, b: Coord) -> Tuple[float, float]:
+    """p 在线段 ab 上的投影：返回 (投影位置 t ∈ [0, 1], p 到投影点的距离 km)"""
     # 投影到弧度平面近似为平面向量计算，短段近似足够
     (x, y) = (math.radians(p[1]), math.radians(p[0]))
     (x1, y1) = (math.radians(a[1]), math.radians(a[0]))
     (x2, y2) = (math.radians(b[1]), math.radians(b[0]))
     dx, dy = x2 - x1, y2 - y1
     if dx == 0 and dy == 0:
-        return haversine_km(p, a)
+        return 0.0, haversine_km(p, a)
     t = ((x - x1) * dx + (y - y1) * dy) / (dx*dx + dy*dy)
     t = max(0.0, min(1.0, t))
     proj = (y1 + t * dy, x1 + t * dx)
     # 反转回 (lat,lng)
     proj_ll = (math.degrees(proj[0]), math.degrees(proj[1]))
-    return haversine_km(p, proj_ll)
+    return t, haversine_km(p, proj_ll)
+
+
+def point_segment_distance_km(p: Coord, a: Coord, b: Coord) -> float:
+    return point_segment_projection(p, a, b)[1]
 
 
 def distance_point_to_polyline_km(p: Coord, poly: List[Coord]) -> float:
@@ -86,6 +167,23 @@ def distance_point_to_polyline_km(p: Coord, poly: List[Coord]) -> float:
     return best if best < float('inf') else 0.0
 
 
+def polyline_progress_km(p: Coord, poly: List[Coord]) -> Tuple[float, float]:
+    """
+    p 在折线上的投影：返回 (沿折线从起点到投影点的里程 km, p 到折线的横向距离 km)。
+    逐段计算，点多时用 spatial_index.PolylineIndex.project。
+    """
+    if len(poly) < 2:
+        return 0.0, (haversine_km(p, poly[0]) if poly else 0.0)
+    best, progress, travelled = float('inf'), 0.0, 0.0
+    for i in range(len(poly) - 1):
+        seg_km = haversine_km(poly[i], poly[i+1])
+        t, d = point_segment_projection(p, poly[i], poly[i+1])
+        if d < best:
+            best, progress = d, travelled + t * seg_km
+        travelled += seg_km
+    return progress, best
+
+
 def rnd(a: float, b: float) -> float:
     return random.uniform(a, b)
 